@@ -0,0 +1,192 @@
+import asyncio
+import math
+import re
+import time
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from config import settings
+
+# First full match wins: (method or None for any, path pattern, class or None to skip)
+ROUTES = [(method, re.compile(pattern), name) for method, pattern, name in (
+    # long-lived streams would hold a slot for as long as the client listens
+    (None, r"/api/videos/events", None),
+    (None, r"/static/.*", None),
+    ("GET", r"/api/stats/admission", None),
+    ("POST", r"/api/videos/upload", "upload"),
+    ("POST", r"/api/users/import", "upload"),
+    # a slot is held for the whole streamed body, often minutes; kept apart
+    # so a few downloads cannot starve uploads
+    ("GET", r"/api/videos/bundle", "download"),
+    ("GET", r"/api/export/.*", "download"),
+    # bcrypt
+    ("POST", r"/api/auth/(login|register)", "auth"),
+    ("PATCH", r"/api/auth/resetpassword", "auth"),
+    ("POST", r"/api/users/?", "auth"),
+    ("PATCH", r"/api/users/(profile)?", "auth"),
+    (None, r"/api/(stats|dashboard)(/.*)?", "analytics"),
+    ("GET", r"/api/users/?", "analytics"),
+    (None, r"/api/.*", "interactive"),
+)]
+
+
+class Limits:
+    def __init__(self, initial: int, minimum: int, maximum: int, queue: int, target: float):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.queue = queue
+        self.target = target
+
+    @classmethod
+    def parse(cls, spec: str):
+        # "limit=8,min=2,max=32,queue=64,target_ms=500"; target_ms=0 keeps the limit fixed
+        values = {}
+        for part in filter(None, (part.strip() for part in spec.split(","))):
+            key, _, value = part.partition("=")
+            values[key.strip()] = int(value)
+        limit = values["limit"]
+        return cls(limit, values.get("min", 1), values.get("max", limit), values.get("queue", limit), values.get("target_ms", 0) / 1000)
+
+
+class Gate:
+    """AIMD concurrency limit with a bounded FIFO wait queue for one route class.
+
+    A request slower than the target latency cuts the limit by DECREASE (at
+    most once per target interval, so one burst of slow requests counts
+    once); a fast request while the gate is at least half busy raises it by
+    1/limit, i.e. by about one per limit's worth of completions.
+    """
+
+    DECREASE = 0.9
+
+    def __init__(self, name: str, limits: Limits):
+        self.name = name
+        self.limits = limits
+        self.limit = float(limits.initial)
+        self.inflight = 0
+        self.waiters = []
+        self.decreased_at = 0.0
+        # seconds, exponentially weighted
+        self.latency = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.inflight < int(self.limit) and not self.waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.limits.queue:
+            self.shed += 1
+            return False
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as error:
+            if waiter.done() and not waiter.cancelled():
+                # handed a slot just as we gave up
+                self.release(None)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            if isinstance(error, asyncio.TimeoutError):
+                self.timed_out += 1
+                return False
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self, latency: float | None):
+        # latency is None for slots that never ran a request
+        self.inflight -= 1
+        if latency is not None:
+            self.adapt(latency)
+        while self.waiters and self.inflight < int(self.limit):
+            waiter = self.waiters.pop(0)
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def adapt(self, latency: float):
+        self.latency = latency if not self.latency else 0.9 * self.latency + 0.1 * latency
+        target = self.limits.target
+        if not target:
+            return
+        now = time.monotonic()
+        if latency > target:
+            if now - self.decreased_at >= target:
+                self.limit = max(self.limits.minimum, self.limit * self.DECREASE)
+                self.decreased_at = now
+        elif self.inflight * 2 >= self.limit:
+            self.limit = min(self.limits.maximum, self.limit + 1 / self.limit)
+
+    def retry_after(self) -> int:
+        # roughly how long the current queue takes to drain
+        return max(1, math.ceil(self.latency * (len(self.waiters) + 1) / max(1, int(self.limit))))
+
+    def metrics(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "waiting": len(self.waiters),
+            "latency_ms": round(self.latency * 1000, 1),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+GATES = {
+    "upload": Gate("upload", Limits.parse(settings.ADMISSION_UPLOAD)),
+    "download": Gate("download", Limits.parse(settings.ADMISSION_DOWNLOAD)),
+    "auth": Gate("auth", Limits.parse(settings.ADMISSION_AUTH)),
+    "analytics": Gate("analytics", Limits.parse(settings.ADMISSION_ANALYTICS)),
+    "interactive": Gate("interactive", Limits.parse(settings.ADMISSION_INTERACTIVE)),
+}
+
+
+def classify(method: str, path: str) -> Gate | None:
+    for route_method, pattern, name in ROUTES:
+        if (route_method is None or route_method == method) and pattern.fullmatch(path):
+            return GATES[name] if name else None
+    return None
+
+
+def metrics() -> dict:
+    return {name: gate.metrics() for name, gate in GATES.items()}
+
+
+class AdmissionMiddleware:
+    """Holds each request in its route class's gate; sheds with 503 when the gate is full.
+
+    Plain ASGI rather than BaseHTTPMiddleware so uploads and streamed
+    responses pass through untouched.  Limits are per worker.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        gate = classify(scope["method"], scope["path"]) if scope["type"] == "http" and settings.ADMISSION_ENABLED else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        if not await gate.acquire(settings.ADMISSION_QUEUE_TIMEOUT):
+            response = JSONResponse(
+                {"detail": "Server is busy, please try again shortly"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(gate.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - started)
@@ -0,0 +1,73 @@
+"""Check that streaming a ZIP bundle keeps memory flat.
+
+    python -m bench.bundle_memory --files 3 --gb 2 --verify
+
+Creates sparse files in a temp directory (no real disk usage), streams a
+bundle of them and reports peak Python allocations alongside the archive
+size.  Peak allocations should stay around a few read chunks no matter
+how many gigabytes go through.  --verify also writes the archive out and
+checks it with zipfile, which exercises the ZIP64 records past 4 GiB.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+from bundle import ZipBundle, file_crc32
+
+
+async def drain(bundle: ZipBundle, out_file=None) -> int:
+    total = 0
+    async for chunk in bundle.stream():
+        total += len(chunk)
+        if out_file:
+            out_file.write(chunk)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ZIP bundle streaming memory")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--gb", type=float, default=2)
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bundle = ZipBundle()
+        size = int(args.gb * 1024 ** 3)
+        for i in range(args.files):
+            path = os.path.join(directory, f"video{i}.mp4")
+            with open(path, "wb") as sparse:
+                sparse.truncate(size)
+            bundle.add(f"video{i}.mp4", size, file_crc32(path), datetime.utcnow(), path=path)
+        bundle.add_bytes("manifest.json", b"{}", datetime.utcnow())
+        bundle.close()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        streamed = asyncio.run(drain(bundle))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert streamed == bundle.size, (streamed, bundle.size)
+        print(f"archive      {bundle.size / 1024 ** 3:8.2f} GiB")
+        print(f"throughput   {bundle.size / elapsed / 1024 ** 2:8.0f} MiB/s")
+        print(f"peak alloc   {peak / 1024 ** 2:8.2f} MiB")
+
+        if args.verify:
+            archive = os.path.join(directory, "bundle.zip")
+            with open(archive, "wb") as out_file:
+                asyncio.run(drain(bundle, out_file))
+            with zipfile.ZipFile(archive) as zipped:
+                bad = zipped.testzip()
+                names = zipped.namelist()
+            print(f"zipfile      {'OK' if bad is None else f'bad member {bad}'} ({len(names)} members)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import math
+import subprocess
+
+# Every seeded account shares this password so scenarios can log in as anyone.
+PASSWORD = "benchmark-pass"
+
+DEFAULT_MONGO_URL = "mongodb://localhost:27017"
+DEFAULT_DB = "eurasia_bench"
+DEFAULT_API_URL = "http://127.0.0.1:9000"
+
+
+def user_email(role: str, index: int) -> str:
+    return f"{role}{index}@bench.local"
+
+
+def percentile(samples: list, pct: float) -> float:
+    # nearest-rank percentile, samples must already be sorted
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
@@ -0,0 +1,49 @@
+"""Diff two benchmark reports written by ``bench.run``.
+
+    python -m bench.compare bench/results/base.json bench/results/head.json
+"""
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "    n/a"
+    return f"{(after - before) / before * 100:+7.1f}%"
+
+
+def db_ops(result: dict) -> float:
+    return sum(result.get("db_ops_per_request", {}).values())
+
+
+def compare(base: dict, head: dict):
+    print(f"base {base['meta']['revision']}  ->  head {head['meta']['revision']}\n")
+    header = f"{'endpoint':<34}" + "".join(f"{metric:>26}" for metric in METRICS + ("db_ops",))
+    print(header)
+    print("-" * len(header))
+    for name in sorted(set(base["endpoints"]) | set(head["endpoints"])):
+        before = base["endpoints"].get(name)
+        after = head["endpoints"].get(name)
+        if not before or not after:
+            print(f"{name:<34} only in {'head' if after else 'base'}")
+            continue
+        row = f"{name:<34}"
+        for metric in METRICS:
+            row += f"{before[metric]:>9} -> {after[metric]:>7} {change(before[metric], after[metric])}"
+        row += f"{db_ops(before):>9} -> {db_ops(after):>7} {change(db_ops(before), db_ops(after))}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+    with open(args.base) as base, open(args.head) as head:
+        compare(json.load(base), json.load(head))
+
+
+if __name__ == "__main__":
+    main()
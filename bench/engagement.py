@@ -0,0 +1,70 @@
+"""Throughput of bulk engagement ingestion against a seeded database.
+
+    python -m bench.seed --videos 100000 --drop
+    python -m bench.engagement --batches 20 --records 5000
+
+Builds batches of random view/like increments for seeded users and link
+updates for seeded videos, applies them through engagement.apply() and
+reports records per second, then replays one batch to time the idempotent
+path.
+"""
+import argparse
+import random
+import time
+import uuid
+
+import pymongo
+
+import engagement
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL
+
+
+def make_batch(rng: random.Random, users: list, videos: list, size: int) -> list:
+    records = []
+    for _ in range(size):
+        if rng.random() < 0.5:
+            records.append({
+                "user_id": str(rng.choice(users)),
+                "views": rng.randint(1, 500),
+                "likes": rng.randint(0, 50),
+                "platform": rng.choice(engagement.PLATFORMS),
+            })
+        else:
+            platform = rng.choice(engagement.PLATFORMS)
+            video_id = rng.choice(videos)
+            records.append({"video_id": str(video_id), platform: f"https://{platform}.com/v/{video_id}"})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk engagement ingestion")
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(args.mongo, serverSelectionTimeoutMS=2000)[args.db]
+    users = [row["_id"] for row in db.users.find({}, {"_id": 1}).limit(20000)]
+    videos = [row["_id"] for row in db.videos.find({}, {"_id": 1}).limit(20000)]
+    if not users or not videos:
+        print("Seed the database first: python -m bench.seed")
+        return
+
+    rng = random.Random(args.seed)
+    batches = [(uuid.uuid4().hex, make_batch(rng, users, videos, args.records)) for _ in range(args.batches)]
+    started = time.perf_counter()
+    for batch_id, records in batches:
+        result = engagement.apply(db.engagement_batches, db.users, db.videos, db.engagement, db.meta, batch_id, records)
+    elapsed = time.perf_counter() - started
+    total = args.batches * args.records
+    print(f"applied {total} records in {elapsed:.2f}s: {total / elapsed:,.0f} records/s ({result['counts']})")
+
+    started = time.perf_counter()
+    engagement.apply(db.engagement_batches, db.users, db.videos, db.engagement, db.meta, *batches[-1])
+    print(f"replayed one batch in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Per-request cost of authenticating an access token.
+
+    python -m bench.jwt_auth --runs 2000
+
+Times what require_user does before its user lookup, jwt_required() plus
+get_jwt_subject(), with the stock fastapi_jwt_auth class and with the
+cached subclass from oauth2, reusing one token the way a browser does.
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from fastapi_jwt_auth import AuthJWT as BaseAuthJWT
+from starlette.requests import Request
+
+from bench.common import percentile
+from oauth2 import AuthJWT, verified_tokens
+
+
+def request_with(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+def timed(auth_class, token: str, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        Authorize = auth_class(request_with(token))
+        Authorize.jwt_required()
+        Authorize.get_jwt_subject()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples
+
+
+def report(name: str, samples: list):
+    print(f"{name:<16} p50={percentile(samples, 50):9.2f}us p99={percentile(samples, 99):9.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark access-token verification")
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    token = AuthJWT().create_access_token(subject="64a000000000000000000000", expires_time=timedelta(minutes=15))
+    report("fastapi_jwt_auth", timed(BaseAuthJWT, token, args.runs))
+    verified_tokens.entries.clear()
+    report("cached", timed(AuthJWT, token, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Per-file overhead of parsing MP4 metadata while copying an upload.
+
+    python -m bench.mp4_probe --size-mb 200 --chunk-kb 1024
+
+Builds a synthetic MP4 in memory (moov after mdat, the worst case for a
+streaming parser) and times a plain chunked copy against the same copy
+with Mp4Probe fed every chunk.
+"""
+import argparse
+import struct
+import time
+
+from media import Mp4Probe
+
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind: bytes, version: int, payload: bytes) -> bytes:
+    return box(kind, struct.pack(">I", version << 24) + payload)
+
+
+def track(handler: bytes, codec: bytes, width: int, height: int, duration: int) -> bytes:
+    tkhd = full_box(b"tkhd", 0, struct.pack(">5I", 0, 0, 1, 0, duration) + bytes(52) + struct.pack(">II", width << 16, height << 16))
+    mdhd = full_box(b"mdhd", 0, struct.pack(">4I", 0, 0, 1000, duration) + bytes(4))
+    hdlr = full_box(b"hdlr", 0, bytes(4) + handler + bytes(12) + b"\0")
+    entry = bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", width, height) + bytes(50)
+    stsd = full_box(b"stsd", 0, struct.pack(">I", 1) + box(codec, entry))
+    stbl = box(b"stbl", stsd)
+    return box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + box(b"minf", stbl)))
+
+
+def sample_mp4(media_size: int) -> bytes:
+    ftyp = box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2avc1mp41")
+    mdat = box(b"mdat", bytes(media_size))
+    mvhd = full_box(b"mvhd", 0, struct.pack(">4I", 0, 0, 1000, 42_000) + bytes(80))
+    moov = box(b"moov", mvhd + track(b"vide", b"avc1", 1080, 1920, 42_000) + track(b"soun", b"mp4a", 0, 0, 42_000))
+    return ftyp + mdat + moov
+
+
+def copy(data: bytes, chunk_size: int, probe: Mp4Probe | None) -> float:
+    started = time.perf_counter()
+    out = bytearray()
+    for offset in range(0, len(data), chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        if probe:
+            probe.feed(chunk)
+        out += chunk
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MP4 metadata extraction")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    data = sample_mp4(args.size_mb * 1024 * 1024)
+    chunk_size = args.chunk_kb * 1024
+    plain = min(copy(data, chunk_size, None) for _ in range(args.runs))
+    probed = []
+    for _ in range(args.runs):
+        probe = Mp4Probe()
+        probed.append(copy(data, chunk_size, probe))
+    print(probe.result())
+    overhead = min(probed) - plain
+    print(f"plain copy   {plain * 1000:9.2f} ms")
+    print(f"with probe   {min(probed) * 1000:9.2f} ms")
+    print(f"overhead     {overhead * 1000:9.2f} ms per {args.size_mb} MB file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Check which replica-set member serves each class of query.
+
+    python -m bench.read_routing --mongo "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+
+Runs the leaderboard and admin dashboard loaders (analytics handles) and a
+primary read through the regular handles, recording every command's server
+with a pymongo CommandListener.  Analytics commands should land on
+secondaries; on a standalone server everything reports the primary.
+"""
+import argparse
+import os
+from collections import Counter
+
+from pymongo import monitoring
+
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL
+
+
+class ServerRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.servers = []
+
+    def started(self, event):
+        if event.command_name in ("aggregate", "find", "count"):
+            self.servers.append(event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show where analytics reads are routed")
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    # settings are read at import, and listeners must exist before the clients do
+    os.environ["DATABASE_URL"] = args.mongo
+    os.environ["MONGO_INITDB_DATABASE"] = args.db
+    recorder = ServerRecorder()
+    monitoring.register(recorder)
+
+    import database
+    from routers.stats import load_dashboard_info, load_leaderboard
+
+    try:
+        database.client.admin.command("ping")
+    except Exception as error:
+        print(f"Mongo unavailable: {error.__class__.__name__}")
+        return
+    primary = database.client.primary
+    print(f"primary: {primary}, secondaries: {sorted(database.client.secondaries)}")
+    for name, run in (
+        ("analytics: leaderboard", load_leaderboard),
+        ("analytics: admin dashboard", load_dashboard_info),
+        ("primary: user lookup", lambda: database.User.find_one({})),
+    ):
+        recorder.servers = []
+        try:
+            run()
+        except Exception as error:
+            print(f"{name:<28} failed: {error.__class__.__name__}")
+            continue
+        counts = Counter("primary" if server == primary else f"secondary {server[0]}:{server[1]}" for server in recorder.servers)
+        print(f"{name:<28} {dict(counts)}")
+
+
+if __name__ == "__main__":
+    main()
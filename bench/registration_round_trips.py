@@ -0,0 +1,109 @@
+"""Count the database round trips of one registration.
+
+    python -m bench.registration_round_trips --mongo mongodb://localhost:27017
+
+Registers a user through /api/auth/register and creates a creator through
+the admin endpoint, recording every command with a pymongo CommandListener.
+Verification emails are not sent.  Exits non-zero when a path takes more
+round trips than budgeted:
+
+    register           insert user, insert token
+    admin create       load admin, allocate hashtag, insert user, insert token
+    duplicate email    insert user (rejected by the unique index)
+"""
+import argparse
+import os
+import sys
+import uuid
+
+from pymongo import monitoring
+
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL, PASSWORD
+
+BUDGETS = {"register": 2, "admin create": 4, "duplicate email": 1}
+# bootstrap, index builds and the like are not part of a registration
+IGNORED = {"createIndexes", "listCollections", "create", "buildInfo", "ping", "hello", "isMaster", "endSessions"}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in IGNORED:
+            self.commands.append(f"{event.command_name} {event.command.get(event.command_name)}")
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class NoMail:
+    def __init__(self, *args):
+        pass
+
+    async def sendVerificationCode(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count round trips per registration")
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.mongo
+    os.environ["MONGO_INITDB_DATABASE"] = args.db
+    # keeps rate limiting out of the count
+    os.environ["RATE_LIMIT_BACKEND"] = "memory"
+    recorder = CommandRecorder()
+    monitoring.register(recorder)
+
+    from fastapi.testclient import TestClient
+    import database
+    import main as app_main
+    import oauth2
+    import routers.auth
+    import routers.user
+
+    try:
+        database.bootstrap()
+    except Exception as error:
+        print(f"Mongo unavailable: {error.__class__.__name__}")
+        return
+    routers.auth.VerifyEmail = routers.user.VerifyEmail = NoMail
+    admin = {"_id": "bench-admin", "role": "admin"}
+    app_main.app.dependency_overrides[oauth2.require_user_doc] = lambda: admin
+
+    def user(role: str) -> dict:
+        email = f"{role}-{uuid.uuid4().hex[:12]}@bench.local"
+        return {"name": "Bench", "email": email, "password": PASSWORD, "passwordConfirm": PASSWORD, "role": role, "mobile": "0"}
+
+    registered = user("marketeer")
+    scenarios = (
+        ("register", "/api/auth/register", registered),
+        # the admin's own lookup is overridden above, so it is added by hand
+        ("admin create", "/api/users/", user("creator")),
+        ("duplicate email", "/api/auth/register", registered),
+    )
+    over = False
+    # no lifespan: its background tasks would add their own commands
+    client = TestClient(app_main.app)
+    for name, path, body in scenarios:
+        recorder.commands = []
+        response = client.post(path, json=body)
+        trips = len(recorder.commands) + (name == "admin create")
+        over |= trips > BUDGETS[name]
+        print(f"{name:<16} {response.status_code} {trips} round trips (budget {BUDGETS[name]})")
+        for command in recorder.commands:
+            print(f"    {command}")
+    created = [row["_id"] for row in database.User.find({"email": {"$in": [body["email"] for _, _, body in scenarios]}}, {"_id": 1})]
+    database.VerificationTokens.delete_many({"user_id": {"$in": created}})
+    database.User.delete_many({"_id": {"$in": created}})
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Bandwidth and CPU per request for heavy JSON responses, with and without http_cache.
+
+    python -m bench.response_cache --users 2000 --requests 500
+
+Builds a payload shaped like GET /api/users/ and serves it repeatedly:
+
+    plain       serialize on every request, uncompressed (the old behaviour)
+    gzip        serialize and gzip on every request
+    cached      http_cache hit: precompressed body, no serialization
+    304         client already holds the current ETag
+
+CPU is process time, so it excludes waiting on the database, which the
+cached paths skip as well.
+"""
+import argparse
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+import http_cache
+
+
+def make_users(count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    return {"status": "success", "users": [
+        {
+            "name": f"User {index}",
+            "role": rng.choice(("creator", "marketeer")),
+            "tiktok": [f"https://tiktok.com/@user{index}"],
+            "youtube": [f"https://youtube.com/@user{index}"] if rng.random() < 0.5 else [],
+            "twitter": [],
+            "facebook": [],
+            "instagram": [f"https://instagram.com/user{index}"] if rng.random() < 0.3 else [],
+            "views": rng.randint(0, 10 ** 6),
+            "likes": rng.randint(0, 10 ** 5),
+            "upload_count": rng.randint(0, 200),
+            "download_count": rng.randint(0, 200),
+            "created_at": start + timedelta(minutes=rng.randint(0, 500000)),
+            "first_40d_download_count": rng.randint(0, 20),
+        }
+        for index in range(count)
+    ]}
+
+
+def request(headers: dict) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/users/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def measure(name: str, requests: int, serve):
+    started = time.process_time()
+    for _ in range(requests):
+        body = serve()
+    cpu = (time.process_time() - started) / requests
+    print(f"{name:<8} {len(body):>10,} bytes  {cpu * 1e6:>10,.0f} µs CPU/request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cached, precompressed responses")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    payload = make_users(args.users, args.seed)
+    key = f"bench:{time.time()}"
+    gzipped = {"Accept-Encoding": "br, gzip"}
+    first = http_cache.cached_response(request(gzipped), key, ("bench",), 3600, lambda: payload)
+    etag = first.headers["etag"]
+    print(f"{args.users} users, brotli {'available' if http_cache.brotli else 'not installed'}")
+
+    measure("plain", args.requests, lambda: JSONResponse(jsonable_encoder(payload)).body)
+    measure("gzip", args.requests, lambda: gzip.compress(JSONResponse(jsonable_encoder(payload)).body, 6))
+    measure("cached", args.requests, lambda: http_cache.cached_response(request(gzipped), key, ("bench",), 3600, lambda: payload).body)
+    measure("304", args.requests, lambda: http_cache.cached_response(
+        request({**gzipped, "If-None-Match": etag}), key, ("bench",), 3600, lambda: payload
+    ).body)
+
+
+if __name__ == "__main__":
+    main()
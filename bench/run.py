@@ -0,0 +1,238 @@
+"""Scripted load scenarios against a running API.
+
+    python -m bench.run --api http://127.0.0.1:9000 --out bench/results/$(git rev-parse --short HEAD).json
+
+The API must point at the same database that ``bench.seed`` filled.
+Each scenario is a list of steps; every step hammers a single endpoint,
+so the server-wide Mongo opcounter delta taken around a step is the
+query cost of that endpoint.  Compare two reports with ``bench.compare``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+import pymongo
+
+from bench.common import (
+    DEFAULT_API_URL,
+    DEFAULT_DB,
+    DEFAULT_MONGO_URL,
+    PASSWORD,
+    git_revision,
+    percentile,
+    user_email,
+)
+from bench.mp4_probe import sample_mp4
+
+OPCOUNTERS = ("query", "getmore", "insert", "update", "delete", "command")
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.db = pymongo.MongoClient(args.mongo)[args.db]
+        self.http = httpx.AsyncClient(base_url=args.api, timeout=args.timeout)
+        self.tokens = {}
+        self.results = {}
+
+    def opcounters(self) -> dict:
+        counters = self.db.command("serverStatus")["opcounters"]
+        return {name: counters.get(name, 0) for name in OPCOUNTERS}
+
+    async def login(self, role: str, index: int) -> str:
+        key = (role, index)
+        if key not in self.tokens:
+            response = await self.http.post(
+                "/api/auth/login",
+                json={"email": user_email(role, index), "password": PASSWORD},
+            )
+            response.raise_for_status()
+            self.tokens[key] = response.json()["access_token"]
+        return self.tokens[key]
+
+    async def auth_headers(self, role: str, count: int) -> list:
+        tokens = [await self.login(role, i) for i in range(count)]
+        return [{"Authorization": f"Bearer {token}"} for token in tokens]
+
+    async def step(self, name: str, make_request, total: int, concurrency: int):
+        latencies = []
+        statuses = Counter()
+        queue = iter(range(total))
+
+        async def worker():
+            for i in queue:
+                started = time.perf_counter()
+                try:
+                    response = await make_request(i)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as error:
+                    statuses[error.__class__.__name__] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        before = self.opcounters()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        after = self.opcounters()
+
+        latencies.sort()
+        errors = sum(n for code, n in statuses.items() if not (isinstance(code, int) and code < 400))
+        self.results[name] = {
+            "requests": total,
+            "concurrency": concurrency,
+            "errors": errors,
+            "statuses": {str(code): n for code, n in statuses.items()},
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "db_ops_per_request": {
+                op: round((after[op] - before[op]) / total, 2) for op in OPCOUNTERS
+            },
+        }
+        print(
+            f"{name:<40} p50={self.results[name]['p50_ms']:>9}ms "
+            f"p99={self.results[name]['p99_ms']:>9}ms "
+            f"rps={self.results[name]['throughput_rps']:>8} errors={errors}"
+        )
+
+    # ---- scenarios ---------------------------------------------------------
+
+    async def login_storm(self):
+        def request(i):
+            index = self.rng.randrange(self.args.marketeers)
+            return self.http.post(
+                "/api/auth/login",
+                json={"email": user_email("marketeer", index), "password": PASSWORD},
+            )
+
+        await self.step("POST /api/auth/login", request, self.args.requests, self.args.concurrency)
+
+    async def browse_loop(self):
+        headers = await self.auth_headers("marketeer", min(self.args.marketeers, self.args.concurrency))
+
+        def request(i):
+            return self.http.get("/api/videos/downloadable", headers=headers[i % len(headers)])
+
+        await self.step("GET /api/videos/downloadable", request, self.args.requests, self.args.concurrency)
+
+    async def claim_contention(self):
+        headers = await self.auth_headers("marketeer", min(self.args.marketeers, self.args.concurrency))
+        # a handful of hot videos that every marketeer tries to claim at once
+        hot = [
+            str(row["_id"])
+            for row in self.db.videos.find({"marketeer": None}, {"_id": 1}).limit(self.args.hot_videos)
+        ]
+        if not hot:
+            print("claim_contention skipped: no unclaimed videos")
+            return
+
+        def request(i):
+            return self.http.put(
+                "/api/videos/download",
+                json={"video_id": hot[i % len(hot)]},
+                headers=headers[i % len(headers)],
+            )
+
+        await self.step("PUT /api/videos/download", request, len(headers) * 3, self.args.concurrency)
+
+    async def admin_dashboard(self):
+        headers = await self.auth_headers("admin", 1)
+        requests = max(1, self.args.requests // 10)
+
+        await self.step(
+            "GET /api/stats/admin",
+            lambda i: self.http.get("/api/stats/admin", headers=headers[0]),
+            requests,
+            min(self.args.concurrency, 4),
+        )
+        await self.step(
+            "GET /api/users/",
+            lambda i: self.http.get("/api/users/", headers=headers[0]),
+            requests,
+            min(self.args.concurrency, 4),
+        )
+
+    async def uploads(self):
+        headers = await self.auth_headers("creator", min(self.args.creators, self.args.concurrency))
+        # a valid ftyp/mdat/moov file, so uploads pass the MP4 probe instead of measuring the 415 path
+        payload = sample_mp4(self.args.upload_kb * 1024)
+
+        def request(i):
+            files = [
+                ("files", (f"bench{n}.mp4", payload, "video/mp4"))
+                for n in range(self.args.upload_files)
+            ]
+            return self.http.post(
+                "/api/videos/upload",
+                files=files,
+                data={"hashtags": "#bench,#load"},
+                headers=headers[i % len(headers)],
+            )
+
+        await self.step(
+            "POST /api/videos/upload",
+            request,
+            max(1, self.args.requests // 10),
+            min(self.args.concurrency, 8),
+        )
+
+    async def run(self, scenarios: list):
+        started = datetime.utcnow()
+        try:
+            for name in scenarios:
+                await getattr(self, name)()
+        finally:
+            await self.http.aclose()
+        return {
+            "meta": {
+                "revision": git_revision(),
+                "started_at": started.isoformat(),
+                "scenarios": scenarios,
+                "seed": self.args.seed,
+                "requests": self.args.requests,
+                "concurrency": self.args.concurrency,
+            },
+            "endpoints": self.results,
+        }
+
+
+SCENARIOS = ["login_storm", "browse_loop", "claim_contention", "admin_dashboard", "uploads"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run benchmark scenarios")
+    parser.add_argument("--api", default=DEFAULT_API_URL)
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=500, help="requests per step")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--creators", type=int, default=200, help="must match bench.seed")
+    parser.add_argument("--marketeers", type=int, default=2000, help="must match bench.seed")
+    parser.add_argument("--hot-videos", type=int, default=5)
+    parser.add_argument("--upload-files", type=int, default=3)
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(Bench(args).run(args.scenarios))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as out_file:
+            json.dump(report, out_file, indent=2, sort_keys=True)
+        print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Seeded synthetic data generator for the benchmark suite.
+
+    python -m bench.seed --creators 200 --marketeers 2000 --videos 1000000 --seed 42 --drop
+
+The same seed always produces the same users and videos, so two runs
+against different commits start from identical data.
+"""
+import argparse
+import calendar
+import random
+import time
+from datetime import datetime, timedelta
+
+import pymongo
+from bson.objectid import ObjectId
+from passlib.context import CryptContext
+
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL, PASSWORD, user_email
+from user_search import search_fields
+
+HASHTAGS = [
+    "#fashion", "#beauty", "#travel", "#food", "#fitness", "#gaming", "#music",
+    "#tech", "#unboxing", "#review", "#summer", "#sale", "#diy", "#pets",
+    "#comedy", "#dance", "#skincare", "#cars", "#football", "#crypto",
+]
+BRANDS = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne", None]
+CHANNELS = ["tiktok", "youtube", "twitter", "facebook", "instagram"]
+HISTORY_DAYS = 540
+
+
+def make_id(rng: random.Random, created_at: datetime) -> ObjectId:
+    # deterministic ids whose timestamp part matches created_at
+    seconds = calendar.timegm(created_at.utctimetuple())
+    return ObjectId(seconds.to_bytes(4, "big") + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def make_channels(rng: random.Random, name: str) -> dict:
+    return {
+        channel: [f"https://{channel}.com/@{name}{n}" for n in range(rng.randint(0, 3))]
+        for channel in CHANNELS
+    }
+
+
+def make_users(rng: random.Random, role: str, count: int, password: str, now: datetime):
+    users = []
+    for i in range(count):
+        created_at = now - timedelta(days=rng.uniform(0, HISTORY_DAYS))
+        user = {
+            "_id": make_id(rng, created_at),
+            "name": f"{role.title()} {i}",
+            "email": user_email(role, i),
+            "mobile": f"+1555{rng.randint(0, 9999999):07d}",
+            "role": role,
+            "views": rng.randint(0, 1_000_000),
+            "likes": rng.randint(0, 100_000),
+            "hashtag": f"#eurasia{str(i).zfill(10)}" if role == "creator" else None,
+            "verified": True,
+            "password": password,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        user.update(make_channels(rng, f"{role}{i}"))
+        user.update(search_fields(user))
+        users.append(user)
+    return users
+
+
+def generate_videos(rng: random.Random, count: int, creators: list, marketeers: list, claimed_ratio: float, now: datetime):
+    for _ in range(count):
+        creator = rng.choice(creators)
+        created_at = now - timedelta(days=rng.uniform(0, HISTORY_DAYS))
+        tags = rng.sample(HASHTAGS, rng.randint(1, 4))
+        tags.append(creator["hashtag"])
+        video = {
+            "_id": make_id(rng, created_at),
+            "brand": rng.choice(BRANDS),
+            "title": f"clip {rng.getrandbits(24):06x}",
+            "filename": f"{rng.getrandbits(128):032x}.mp4",
+            "creator": creator["_id"],
+            "marketeer": None,
+            "hashtags": tags,
+            "uploaded_at": created_at,
+            "downloaded_at": None,
+            "tiktok": None,
+            "youtube": None,
+            "twitter": None,
+            "facebook": None,
+            "instagram": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        if marketeers and rng.random() < claimed_ratio:
+            downloaded_at = created_at + (now - created_at) * rng.random()
+            video["marketeer"] = rng.choice(marketeers)["_id"]
+            video["downloaded_at"] = downloaded_at
+            video["updated_at"] = downloaded_at
+            for channel in rng.sample(CHANNELS, rng.randint(0, 2)):
+                video[channel] = f"https://{channel}.com/v/{rng.getrandbits(40):010x}"
+        yield video
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    client = pymongo.MongoClient(args.url)
+    db = client[args.db]
+
+    if args.drop:
+        db.users.drop()
+        db.videos.drop()
+        db.meta.drop()
+
+    # bcrypt once: every account shares the same hash
+    password = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+
+    admins = make_users(rng, "admin", args.admins, password, now)
+    creators = make_users(rng, "creator", args.creators, password, now)
+    marketeers = make_users(rng, "marketeer", args.marketeers, password, now)
+    users = admins + creators + marketeers
+    db.users.create_index([("email", pymongo.ASCENDING)], unique=True)
+    for i in range(0, len(users), args.batch):
+        db.users.insert_many(users[i:i + args.batch], ordered=False)
+    print(f"Inserted {len(users)} users")
+
+    started = time.perf_counter()
+    batch = []
+    inserted = 0
+    for video in generate_videos(rng, args.videos, creators, marketeers, args.claimed, now):
+        batch.append(video)
+        if len(batch) == args.batch:
+            db.videos.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+            print(f"Inserted {inserted}/{args.videos} videos", end="\r")
+    if batch:
+        db.videos.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    print(f"Inserted {inserted} videos in {time.perf_counter() - started:.1f}s")
+
+    if db.meta.count_documents({}) == 0:
+        db.meta.insert_one({"rewards": 0})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    parser.add_argument("--url", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--creators", type=int, default=200)
+    parser.add_argument("--marketeers", type=int, default=2000)
+    parser.add_argument("--videos", type=int, default=100_000)
+    parser.add_argument("--claimed", type=float, default=0.6, help="fraction of videos already claimed")
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--drop", action="store_true", help="drop existing collections first")
+    seed(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
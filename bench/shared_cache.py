@@ -0,0 +1,67 @@
+"""Hit latency of the shared-memory cache against a Mongo read.
+
+    python -m bench.shared_cache --mongo mongodb://localhost:27017 --db eurasia_bench
+
+Times repeated hits on a jackpot-sized and a dashboard-sized entry, and
+the Meta.find_one the jackpot entry replaces.  The Mongo part is skipped
+when no server answers.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pymongo
+
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL, percentile
+from shared_cache import SharedCache
+
+
+def timed(fn, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples
+
+
+def report(name: str, samples: list):
+    print(f"{name:<28} p50={percentile(samples, 50):9.2f}us p99={percentile(samples, 99):9.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared cache")
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--runs", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SharedCache(os.path.join(directory, "cache"), 256, 64 * 1024)
+        dashboard = {
+            "creators": 1200, "marketeers": 40000, "videos": 1_000_000,
+            "performance": [
+                {"uploads": 1000 + i, "downloads": 500 + i, "marketeers": 20 + i, "month_abbr": "Jan"}
+                for i in range(12)
+            ],
+        }
+        cache.set("stats:jackpot", 25000, 60)
+        cache.set("stats:admin", dashboard, 60)
+        report("shared cache jackpot hit", timed(lambda: cache.get("stats:jackpot"), args.runs))
+        report("shared cache dashboard hit", timed(lambda: cache.get("stats:admin"), args.runs))
+        report("shared cache miss", timed(lambda: cache.get("stats:none"), args.runs))
+
+    client = pymongo.MongoClient(args.mongo, serverSelectionTimeoutMS=2000)
+    try:
+        meta = client[args.db].meta
+        meta.find_one({})
+    except pymongo.errors.PyMongoError as error:
+        print(f"Mongo comparison skipped: {error.__class__.__name__}")
+        return
+    report("Meta.find_one", timed(lambda: meta.find_one({}), min(args.runs, 5000)))
+
+
+if __name__ == "__main__":
+    main()
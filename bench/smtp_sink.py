@@ -0,0 +1,81 @@
+"""Minimal SMTP server that accepts and discards every message.
+
+    python -m bench.smtp_sink --port 1025
+
+Run the API with EMAIL_HOST=127.0.0.1, EMAIL_PORT=1025 and
+EMAIL_STARTTLS=false so registration and password resets never leave
+the machine.
+"""
+import argparse
+import asyncio
+
+received = 0
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    global received
+
+    async def reply(line: str):
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    await reply("220 bench.local ESMTP sink")
+    try:
+        while line := await reader.readline():
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                await reply("250-bench.local")
+                await reply("250-AUTH PLAIN LOGIN")
+                await reply("250 8BITMIME")
+            elif verb == "HELO":
+                await reply("250 bench.local")
+            elif verb == "AUTH":
+                parts = command.split(" ")
+                if parts[1].upper() == "LOGIN":
+                    # username (unless sent inline) and password prompts
+                    if len(parts) == 2:
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                    await reply("334 UGFzc3dvcmQ6")
+                    await reader.readline()
+                elif len(parts) == 2:
+                    await reply("334 ")
+                    await reader.readline()
+                await reply("235 Authentication successful")
+            elif verb == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                received += 1
+                await reply("250 OK")
+            elif verb == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                await reply("250 OK")
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(handle, host, port)
+    print(f"SMTP sink listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n{received} messages received")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure worker import time and time to first request.
+
+    python -m bench.startup --runs 5
+
+Each run spawns a fresh interpreter, so the numbers include everything a
+gunicorn worker pays on boot.  Time to ready additionally waits for the
+database bootstrap to finish (``/ready`` returning 200).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def import_time() -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET])
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def wait_for(url: str, deadline: float) -> float | None:
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def serve_times(port: int, timeout: float) -> tuple:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+    )
+    try:
+        deadline = started + timeout
+        first = wait_for(f"http://127.0.0.1:{port}/", deadline)
+        ready = wait_for(f"http://127.0.0.1:{port}/ready", deadline)
+    finally:
+        server.terminate()
+        server.wait()
+    return (
+        first - started if first else None,
+        ready - started if ready else None,
+    )
+
+
+def summary(samples: list) -> dict:
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return {"runs": 0}
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    first, ready = zip(*(serve_times(args.port, args.timeout) for _ in range(args.runs)))
+    print(json.dumps({
+        "import": summary(imports),
+        "first_request": summary(list(first)),
+        "ready": summary(list(ready)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
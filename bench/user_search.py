@@ -0,0 +1,78 @@
+"""Latency of admin user search on a seeded database.
+
+    python -m bench.seed --marketeers 1000000 --videos 0 --drop
+    python -m bench.user_search --queries 200
+
+Samples real names, emails and phone numbers from the users collection,
+turns them into short prefixes, long prefixes, phone prefixes, typo'd
+fuzzy queries and second pages, and reports latency percentiles per kind
+from user_search.search() (the endpoint minus HTTP).
+"""
+import argparse
+import os
+import random
+import time
+
+from bench.common import DEFAULT_DB, DEFAULT_MONGO_URL, percentile
+
+
+def typo(rng: random.Random, text: str) -> str:
+    # swap two neighbouring characters
+    if len(text) < 3:
+        return text
+    i = rng.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark admin user search")
+    parser.add_argument("--mongo", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.mongo
+    os.environ["MONGO_INITDB_DATABASE"] = args.db
+    import database
+    import user_search
+
+    database.ensure_indexes()
+    sample = list(database.User.aggregate([
+        {"$sample": {"size": args.queries}},
+        {"$project": {"name": 1, "email": 1, "mobile": 1}},
+    ]))
+    if not sample:
+        print("Seed the database first: python -m bench.seed")
+        return
+    print(f"{database.User.estimated_document_count():,} users")
+
+    rng = random.Random(args.seed)
+    kinds = {
+        "short prefix": lambda user: (user["name"][:rng.randint(2, 6)], None, False, None),
+        "long prefix": lambda user: (user["email"][:rng.randint(12, 20)], None, False, None),
+        "phone": lambda user: (user["mobile"][:rng.randint(6, 12)], None, False, None),
+        "role + prefix": lambda user: (user["name"][:4], "creator", False, None),
+        "fuzzy": lambda user: (typo(rng, user["name"]), None, True, None),
+    }
+    for kind, make in kinds.items():
+        timings = []
+        for user in sample:
+            query, role, fuzzy, cursor = make(user)
+            started = time.perf_counter()
+            _, next_cursor = user_search.search(database.User, query, role, fuzzy, cursor, args.limit)
+            timings.append(time.perf_counter() - started)
+            if kind == "short prefix" and next_cursor:
+                started = time.perf_counter()
+                user_search.search(database.User, query, role, fuzzy, next_cursor, args.limit)
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(
+            f"{kind:<14} p50 {percentile(timings, 50) * 1000:6.1f}ms  "
+            f"p95 {percentile(timings, 95) * 1000:6.1f}ms  max {timings[-1] * 1000:6.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
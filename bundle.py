@@ -0,0 +1,140 @@
+import re
+import struct
+import zlib
+from datetime import datetime
+
+import aiofiles
+
+ZIP64_LIMIT = 0xFFFFFFFF
+READ_CHUNK_SIZE = 1024 * 1024
+UTF8_NAMES = 0x0800
+
+
+def dos_datetime(moment: datetime):
+    moment = max(moment, datetime(1980, 1, 1))
+    return (
+        (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+        ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day,
+    )
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as source:
+        while chunk := source.read(READ_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class ZipBundle:
+    """Store-mode ZIP whose every byte offset is known before streaming starts.
+
+    Sizes and CRC-32s of all members are supplied up front, so headers never
+    need data descriptors and any byte range of the archive can be produced
+    on its own, which is what makes Range/resume possible.  ZIP64 records are
+    added only where a size or offset needs them.
+    """
+
+    def __init__(self):
+        # (offset, length, bytes) for generated data or (offset, length, path) for files
+        self.segments = []
+        self.central = []
+        self.size = 0
+        self.count = 0
+
+    def append(self, data: bytes | str, length: int):
+        self.segments.append((self.size, length, data))
+        self.size += length
+
+    def add(self, name: str, size: int, crc: int, modified: datetime, path: str | None = None, data: bytes | None = None):
+        encoded = name.encode("utf-8")
+        offset = self.size
+        dos_time, dos_date = dos_datetime(modified)
+
+        zip64 = size >= ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 0x0001, 16, size, size) if zip64 else b""
+        header_size = ZIP64_LIMIT if zip64 else size
+        header = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, UTF8_NAMES, 0,
+            dos_time, dos_date, crc, header_size, header_size, len(encoded), len(extra),
+        ) + encoded + extra
+        self.append(header, len(header))
+        self.append(path if path is not None else data, size)
+
+        central_extra = b""
+        if zip64:
+            central_extra += struct.pack("<QQ", size, size)
+        if offset >= ZIP64_LIMIT:
+            central_extra += struct.pack("<Q", offset)
+        if central_extra:
+            central_extra = struct.pack("<HH", 0x0001, len(central_extra)) + central_extra
+        version = 45 if central_extra else 20
+        self.central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, version, version, UTF8_NAMES, 0,
+            dos_time, dos_date, crc, header_size, header_size, len(encoded),
+            len(central_extra), 0, 0, 0, 0, min(offset, ZIP64_LIMIT),
+        ) + encoded + central_extra)
+        self.count += 1
+
+    def add_bytes(self, name: str, data: bytes, modified: datetime):
+        self.add(name, len(data), zlib.crc32(data), modified, data=data)
+
+    def close(self):
+        central = b"".join(self.central)
+        offset = self.size
+        tail = central
+        if offset >= ZIP64_LIMIT or len(central) >= ZIP64_LIMIT or self.count >= 0xFFFF:
+            zip64_offset = offset + len(central)
+            tail += struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0,
+                self.count, self.count, len(central), offset,
+            )
+            tail += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+        tail += struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, min(self.count, 0xFFFF), min(self.count, 0xFFFF),
+            min(len(central), ZIP64_LIMIT), min(offset, ZIP64_LIMIT), 0,
+        )
+        self.append(tail, len(tail))
+        self.central = []
+
+    async def stream(self, start: int = 0, end: int | None = None):
+        # yields archive bytes [start, end] inclusive, reading files in chunks
+        end = self.size - 1 if end is None else end
+        for offset, length, data in self.segments:
+            if offset + length <= start or offset > end:
+                continue
+            first = max(start - offset, 0)
+            last = min(end - offset, length - 1)
+            if isinstance(data, bytes):
+                yield data[first:last + 1]
+                continue
+            remaining = last - first + 1
+            async with aiofiles.open(data, "rb") as source:
+                await source.seek(first)
+                while remaining > 0:
+                    chunk = await source.read(min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OSError(f"{data} is shorter than expected")
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+def parse_range(header: str, size: int):
+    # single "bytes=start-end" range -> inclusive (start, end); ValueError if unsatisfiable.
+    # Anything unparseable is ignored (None), so the full body is sent (RFC 9110 14.2)
+    unit, _, spec = header.partition("=")
+    match = re.fullmatch(r"(\d*)-(\d*)", spec.strip())
+    if unit.strip() != "bytes" or not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None
+    if not first:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
@@ -4,12 +4,20 @@ from pydantic import BaseSettings, EmailStr
 class Settings(BaseSettings):
     DATABASE_URL: str
     MONGO_INITDB_DATABASE: str
+    MONGO_POOL_SIZE: int = 100
+    # defaults to DATABASE_URL; point it at the replica set to use secondaries
+    ANALYTICS_DATABASE_URL: str = ""
+    ANALYTICS_POOL_SIZE: int = 20
+    # the server rejects anything below 90
+    ANALYTICS_MAX_STALENESS_SECONDS: int = 120
 
     JWT_PUBLIC_KEY: str
     JWT_PRIVATE_KEY: str
     REFRESH_TOKEN_EXPIRES_IN: int
     ACCESS_TOKEN_EXPIRES_IN: int
     JWT_ALGORITHM: str
+    JWT_CACHE_SIZE: int = 10000
+    VERIFICATION_TOKEN_HOURS: int = 48
 
     CLIENT_ORIGIN: str
 
@@ -18,6 +26,90 @@ class Settings(BaseSettings):
     EMAIL_USERNAME: str
     EMAIL_PASSWORD: str
     EMAIL_FROM: EmailStr
+    EMAIL_STARTTLS: bool = True
+
+    TRENDING_HALF_LIFE_MINUTES: int = 60
+    TRENDING_SYNC_SECONDS: int = 10
+    TRENDING_TOP_K: int = 50
+    TRENDING_SKETCH_WIDTH: int = 2048
+    TRENDING_SKETCH_DEPTH: int = 4
+
+    EVENTS_HISTORY: int = 1000
+    EVENTS_CAPPED_BYTES: int = 16 * 1024 * 1024
+
+    SHARED_CACHE_PATH: str = ""
+    SHARED_CACHE_SLOTS: int = 256
+    SHARED_CACHE_SLOT_BYTES: int = 64 * 1024
+    STATS_CACHE_SECONDS: int = 30
+    # serialized, precompressed response bodies kept per worker, see http_cache.py
+    RESPONSE_CACHE_ENTRIES: int = 512
+
+    # "memory" limits each worker on its own; "mongo" shares buckets across workers
+    RATE_LIMIT_BACKEND: str = "memory"
+    # 0 uses the socket peer and ignores X-Forwarded-For, which any client can
+    # forge.  Behind a proxy (nginx in front of the uvicorn socket, the Heroku
+    # router) set it to the number of proxies that append to the header.
+    RATE_LIMIT_TRUSTED_PROXIES: int = 0
+    RATE_LIMIT_LOGIN: str = "ip:20/minute,email:5/minute"
+    RATE_LIMIT_REGISTER: str = "ip:5/minute"
+    RATE_LIMIT_RESET_PASSWORD: str = "ip:5/minute,email:3/hour"
+
+    QUERY_POOL_SIZE: int = 16
+    DASHBOARD_SECTION_TIMEOUT: float = 5
+
+    ENGAGEMENT_MAX_RECORDS: int = 10000
+    ENGAGEMENT_RAW_DAYS: int = 7
+    ENGAGEMENT_HOURLY_DAYS: int = 90
+    # 0 keeps daily history forever
+    ENGAGEMENT_DAILY_DAYS: int = 0
+    ENGAGEMENT_ROLLUP_SECONDS: int = 300
+
+    UPLOAD_GC_INTERVAL_MINUTES: int = 60
+    UPLOAD_GC_GRACE_MINUTES: int = 360
+    UPLOAD_GC_BATCH_SIZE: int = 500
+    UPLOAD_GC_BATCH_PAUSE: float = 0.05
+    UPLOAD_GC_DRY_RUN: bool = False
+    # move orphans here instead of deleting them (keep it outside static/)
+    UPLOAD_GC_QUARANTINE: str = ""
+
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_HASH_THREADS: int = 2
+    IMPORT_EMAIL_CONCURRENCY: int = 4
+    IMPORT_MAX_ERRORS: int = 1000
+
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Per-worker concurrency per route class, see admission.py.
+    # limit is the starting point; target_ms=0 keeps it fixed.
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_QUEUE_TIMEOUT: float = 2
+    ADMISSION_UPLOAD: str = "limit=4,queue=8"
+    # bundles and exports: disk and network bound, held for the whole stream
+    ADMISSION_DOWNLOAD: str = "limit=8,queue=8"
+    ADMISSION_AUTH: str = "limit=4,min=1,max=8,queue=32,target_ms=1000"
+    ADMISSION_ANALYTICS: str = "limit=4,min=1,max=16,queue=16,target_ms=2000"
+    ADMISSION_INTERACTIVE: str = "limit=64,min=8,max=256,queue=256,target_ms=500"
+
+    # "" turns tracing off; "jsonl" appends to TRACING_JSONL_PATH, "otlp" posts
+    # OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT.  See tracing.py.
+    TRACING_EXPORTER: str = ""
+    TRACING_SERVICE_NAME: str = "api"
+    TRACING_SAMPLE_RATE: float = 0.05
+    # requests at least this slow are exported even when not sampled; 0 disables
+    TRACING_SLOW_MS: int = 1000
+    TRACING_JSONL_PATH: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_FLUSH_SECONDS: float = 2
+
+    # On-demand request profiling, see profiling.py.  Admins send PROFILE_HEADER;
+    # PROFILE_SAMPLE_RATE profiles a fraction of all traffic, keeping the slow ones.
+    PROFILE_ENABLED: bool = True
+    PROFILE_HEADER: str = "X-Profile"
+    PROFILE_SAMPLE_RATE: float = 0
+    PROFILE_MIN_MS: int = 1000
+    PROFILE_INTERVAL_MS: int = 10
+    PROFILE_MAX_ACTIVE: int = 4
+    PROFILE_RETENTION_HOURS: int = 72
 
     class Config:
         env_file = './.env'
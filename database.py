@@ -1,23 +1,242 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import mongo_client
+from pymongo.errors import CollectionInvalid, OperationFailure
 import pymongo
+from pymongo import ReturnDocument
 from config import settings
+import tracing
 
+# MongoClient connects in the background, so building it here does not block;
+# everything that needs a round trip lives in bootstrap() and runs from the
+# app lifespan instead of at import time.
 client = mongo_client.MongoClient(
-    settings.DATABASE_URL, serverSelectionTimeoutMS=5000)
-
-try:
-    conn = client.server_info()
-    print(f'Connected to MongoDB {conn.get("version")}')
-except Exception:
-    print("Unable to connect to the MongoDB server.")
+    settings.DATABASE_URL, serverSelectionTimeoutMS=5000,
+    maxPoolSize=settings.MONGO_POOL_SIZE, event_listeners=[tracing.CommandTracer()])
 
 db = client[settings.MONGO_INITDB_DATABASE]
 
+# Heavy read-only aggregations get their own pool and prefer secondaries, so
+# they don't compete with uploads and claims on the primary.  Results may lag
+# the primary by up to ANALYTICS_MAX_STALENESS_SECONDS; on a standalone server
+# or with no healthy secondary they fall back to the primary.
+analytics_client = mongo_client.MongoClient(
+    settings.ANALYTICS_DATABASE_URL or settings.DATABASE_URL,
+    serverSelectionTimeoutMS=5000,
+    maxPoolSize=settings.ANALYTICS_POOL_SIZE,
+    readPreference="secondaryPreferred",
+    maxStalenessSeconds=settings.ANALYTICS_MAX_STALENESS_SECONDS,
+    event_listeners=[tracing.CommandTracer()],
+)
+
+analytics_db = analytics_client[settings.MONGO_INITDB_DATABASE]
+
 User = db.users
-User.create_index([("email", pymongo.ASCENDING)], unique=True)
 
 Video = db.videos
 
 Meta = db.meta
-if Meta.count_documents({}) == 0:
-    Meta.insert_one({"rewards": 0})
\ No newline at end of file
+
+Trending = db.trending
+
+Events = db.events
+
+RateLimits = db.rate_limits
+
+Jobs = db.jobs
+
+# Single-use tokens keyed by their sha256, see tokens.py
+VerificationTokens = db.verification_tokens
+
+EngagementBatches = db.engagement_batches
+
+# Request profiles for download by admins, see profiling.py
+Profiles = db.profiles
+
+# Raw engagement points (time series) and their hourly/daily rollups
+Engagement = db.engagement
+
+EngagementHourly = db.engagement_hour
+
+EngagementDaily = db.engagement_day
+
+AnalyticsUser = analytics_db.users
+
+AnalyticsVideo = analytics_db.videos
+
+AnalyticsEngagement = analytics_db.engagement
+
+AnalyticsEngagementHourly = analytics_db.engagement_hour
+
+AnalyticsEngagementDaily = analytics_db.engagement_day
+
+# engagement.history() reads the rollup boundary with the rollups themselves
+AnalyticsMeta = analytics_db.meta
+
+# Independent queries of one request run side by side on this pool
+query_pool = ThreadPoolExecutor(settings.QUERY_POOL_SIZE, thread_name_prefix="query")
+
+
+def concurrently(*calls):
+    # Each call sees the caller's context, so an enclosing pymongo.timeout()
+    # bounds these queries too.  Calls must not nest concurrently() themselves.
+    context = contextvars.copy_context()
+    futures = [query_pool.submit(context.copy().run, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def ensure_ttl(collection, field: str, seconds: int):
+    # create_index will not change expireAfterSeconds on an existing index
+    # (IndexOptionsConflict), so a changed setting is applied with collMod
+    try:
+        collection.create_index(field, expireAfterSeconds=seconds)
+    except OperationFailure as error:
+        if error.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        collection.database.command(
+            "collMod", collection.name, index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds})
+
+
+def ensure_indexes():
+    User.create_index([("email", pymongo.ASCENDING)], unique=True)
+
+    # Admin user search, see user_search.py
+    User.create_index([("search_prefixes", pymongo.ASCENDING), ("_id", pymongo.DESCENDING)])
+    User.create_index("search_terms")
+    User.create_index("search_trigrams")
+    User.create_index([("role", pymongo.ASCENDING), ("_id", pymongo.DESCENDING)])
+
+    # Downloadable-video search: every query is scoped to unclaimed videos
+    # (marketeer: None) and sorted newest first.
+    for field in ("hashtags", "brand_key", "title_key"):
+        Video.create_index([
+            ("marketeer", pymongo.ASCENDING),
+            (field, pymongo.ASCENDING),
+            ("uploaded_at", pymongo.DESCENDING),
+            ("_id", pymongo.DESCENDING),
+        ])
+    Video.create_index([
+        ("marketeer", pymongo.ASCENDING),
+        ("uploaded_at", pymongo.DESCENDING),
+        ("_id", pymongo.DESCENDING),
+    ])
+
+    # Orphan upload collection checks files against this in batches
+    Video.create_index("filename")
+
+    # Exports walk these in order, see routers/export.py
+    User.create_index("created_at")
+    Video.create_index("uploaded_at")
+    Video.create_index("downloaded_at", sparse=True)
+
+    # One document per (worker, kind); workers that went away age out.
+    Trending.create_index([("worker", pymongo.ASCENDING), ("kind", pymongo.ASCENDING)], unique=True)
+    ensure_ttl(Trending, "updated_at", settings.TRENDING_HALF_LIFE_MINUTES * 60 * 4)
+
+    # Each bucket stores when it will be full again; after that it can go.
+    RateLimits.create_index("expires_at", expireAfterSeconds=0)
+
+    Jobs.create_index("created_at", expireAfterSeconds=7 * 24 * 3600)
+
+    # _id is the token hash, which is already unique; expired tokens are dropped
+    VerificationTokens.create_index("expires_at", expireAfterSeconds=0)
+    VerificationTokens.create_index([("user_id", pymongo.ASCENDING), ("purpose", pymongo.ASCENDING)])
+
+    ensure_ttl(Profiles, "created_at", settings.PROFILE_RETENTION_HOURS * 3600)
+
+    # Batch ids stay replayable for a week
+    EngagementBatches.create_index("created_at", expireAfterSeconds=7 * 24 * 3600)
+
+    Engagement.create_index([("meta.creator", pymongo.ASCENDING), ("ts", pymongo.ASCENDING)])
+    Engagement.create_index([("meta.video", pymongo.ASCENDING), ("ts", pymongo.ASCENDING)])
+    for rollup, days in ((EngagementHourly, settings.ENGAGEMENT_HOURLY_DAYS), (EngagementDaily, settings.ENGAGEMENT_DAILY_DAYS)):
+        rollup.create_index([("creator", pymongo.ASCENDING), ("t", pymongo.ASCENDING)])
+        rollup.create_index([("video", pymongo.ASCENDING), ("t", pymongo.ASCENDING)])
+        if days:
+            ensure_ttl(rollup, "t", days * 24 * 3600)
+        elif "t_1" in rollup.index_information():
+            # switched to keeping history forever
+            rollup.drop_index("t_1")
+
+
+def ensure_collections():
+    names = db.list_collection_names()
+    # Capped so the event log used for cross-worker fan-out and resume stays bounded
+    if "events" not in names:
+        try:
+            db.create_collection("events", capped=True, size=settings.EVENTS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass
+    # Time series (MongoDB 5.0+): points are stored in per-series buckets and
+    # dropped after ENGAGEMENT_RAW_DAYS; older history lives in the rollups.
+    if "engagement" not in names:
+        try:
+            db.create_collection(
+                "engagement",
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=settings.ENGAGEMENT_RAW_DAYS * 24 * 3600,
+            )
+        except CollectionInvalid:
+            pass
+    else:
+        # the collection outlives its creation options; keep the expiry in step with the setting
+        try:
+            db.command("collMod", "engagement", expireAfterSeconds=settings.ENGAGEMENT_RAW_DAYS * 24 * 3600)
+        except OperationFailure as error:
+            # a plain collection on a server without time series
+            print(f"Unable to update engagement expiry: {error}")
+
+
+def seed_meta():
+    Meta.update_one({}, {"$setOnInsert": {"rewards": 0}}, upsert=True)
+    # Creator hashtags used to be numbered by counting creators; carry on from there
+    Meta.update_one(
+        {"creator_sequence": {"$exists": False}},
+        {"$set": {"creator_sequence": User.count_documents({"role": "creator"})}},
+    )
+
+
+def allocate_creator_hashtags(count: int):
+    if not count:
+        return []
+    increment = ({"creator_sequence": {"$exists": True}}, {"$inc": {"creator_sequence": count}})
+    meta = Meta.find_one_and_update(*increment, return_document=ReturnDocument.AFTER)
+    if meta is None:
+        # called before bootstrap() got to seed the sequence
+        seed_meta()
+        meta = Meta.find_one_and_update(*increment, return_document=ReturnDocument.AFTER)
+    end = meta["creator_sequence"]
+    return [f"#eurasia{str(number).zfill(10)}" for number in range(end - count, end)]
+
+
+def bootstrap():
+    conn = client.server_info()
+    print(f'Connected to MongoDB {conn.get("version")}')
+    ensure_collections()
+    ensure_indexes()
+    seed_meta()
+
+
+async def connect(retry_delay: float = 1, max_delay: float = 30):
+    # Retry with backoff instead of crashing the worker while Mongo is down
+    delay = retry_delay
+    while True:
+        try:
+            await asyncio.to_thread(bootstrap)
+            return
+        except Exception as error:
+            print(f"Unable to connect to the MongoDB server: {error}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+async def ping() -> bool:
+    try:
+        await asyncio.to_thread(client.admin.command, "ping")
+        return True
+    except Exception:
+        return False
@@ -1,14 +1,18 @@
+from functools import lru_cache
 from typing import List
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr, BaseModel
 from config import settings
+import tracing
 from jinja2 import Environment, select_autoescape, PackageLoader
 
 
-env = Environment(
-    loader=PackageLoader('templates', 'contact'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+@lru_cache
+def get_env():
+    return Environment(
+        loader=PackageLoader('templates', 'contact'),
+        autoescape=select_autoescape(['html', 'xml'])
+    )
 
 
 class ContactEmail:
@@ -29,20 +33,21 @@ class ContactEmail:
             MAIL_FROM=settings.EMAIL_FROM,
             MAIL_PORT=settings.EMAIL_PORT,
             MAIL_SERVER=settings.EMAIL_HOST,
-            MAIL_STARTTLS=True,
+            MAIL_STARTTLS=settings.EMAIL_STARTTLS,
             MAIL_SSL_TLS=False,
         )
         # Generate the HTML template base on the template name
-        template = env.get_template(f'{template}.html')
-
-        html = template.render(
-            msg=self.msg,
-            sender_email=self.sender_email,
-            name=self.name,
-            reg_email=self.reg_email,
-            role=self.role,
-            subject=subject
-        )
+        with tracing.span("email.render", template=template):
+            template = get_env().get_template(f'{template}.html')
+
+            html = template.render(
+                msg=self.msg,
+                sender_email=self.sender_email,
+                name=self.name,
+                reg_email=self.reg_email,
+                role=self.role,
+                subject=subject
+            )
 
         # Define the message options
         message = MessageSchema(
@@ -54,7 +59,8 @@ class ContactEmail:
 
         # Send the email
         fm = FastMail(conf)
-        await fm.send_message(message)
+        with tracing.span("email.send", kind=tracing.CLIENT, **{"net.peer.name": settings.EMAIL_HOST}):
+            await fm.send_message(message)
 
     async def sendContent(self):
         await self.sendMail('Contact', 'contact')
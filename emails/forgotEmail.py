@@ -1,14 +1,18 @@
+from functools import lru_cache
 from typing import List
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr
 from config import settings
+import tracing
 from jinja2 import Environment, select_autoescape, PackageLoader
 
 
-env = Environment(
-    loader=PackageLoader('templates', 'forgot'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+@lru_cache
+def get_env():
+    return Environment(
+        loader=PackageLoader('templates', 'forgot'),
+        autoescape=select_autoescape(['html', 'xml'])
+    )
 
 
 class ForgotEmail:
@@ -26,17 +30,18 @@ class ForgotEmail:
             MAIL_FROM=settings.EMAIL_FROM,
             MAIL_PORT=settings.EMAIL_PORT,
             MAIL_SERVER=settings.EMAIL_HOST,
-            MAIL_STARTTLS=True,
+            MAIL_STARTTLS=settings.EMAIL_STARTTLS,
             MAIL_SSL_TLS=False,
         )
         # Generate the HTML template base on the template name
-        template = env.get_template(f'{template}.html')
+        with tracing.span("email.render", template=template):
+            template = get_env().get_template(f'{template}.html')
 
-        html = template.render(
-            password=self.password,
-            first_name=self.name,
-            subject=subject
-        )
+            html = template.render(
+                password=self.password,
+                first_name=self.name,
+                subject=subject
+            )
 
         # Define the message options
         message = MessageSchema(
@@ -48,7 +53,8 @@ class ForgotEmail:
 
         # Send the email
         fm = FastMail(conf)
-        await fm.send_message(message)
+        with tracing.span("email.send", kind=tracing.CLIENT, **{"net.peer.name": settings.EMAIL_HOST}):
+            await fm.send_message(message)
 
     async def sendResetPassword(self):
         await self.sendMail('Your password reset', 'forgot')
@@ -1,14 +1,19 @@
+from functools import lru_cache
 from typing import List
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr, BaseModel
 from config import settings
+import tracing
 from jinja2 import Environment, select_autoescape, PackageLoader
 
 
-env = Environment(
-    loader=PackageLoader('templates', 'verify'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+@lru_cache
+def get_env():
+    # Built on first send rather than at import to keep worker boot fast
+    return Environment(
+        loader=PackageLoader('templates', 'verify'),
+        autoescape=select_autoescape(['html', 'xml'])
+    )
 
 
 class EmailSchema(BaseModel):
@@ -30,17 +35,18 @@ class VerifyEmail:
             MAIL_FROM=settings.EMAIL_FROM,
             MAIL_PORT=settings.EMAIL_PORT,
             MAIL_SERVER=settings.EMAIL_HOST,
-            MAIL_STARTTLS=True,
+            MAIL_STARTTLS=settings.EMAIL_STARTTLS,
             MAIL_SSL_TLS=False,
         )
         # Generate the HTML template base on the template name
-        template = env.get_template(f'{template}.html')
+        with tracing.span("email.render", template=template):
+            template = get_env().get_template(f'{template}.html')
 
-        html = template.render(
-            code=self.code,
-            first_name=self.name,
-            subject=subject
-        )
+            html = template.render(
+                code=self.code,
+                first_name=self.name,
+                subject=subject
+            )
 
         # Define the message options
         message = MessageSchema(
@@ -52,7 +58,8 @@ class VerifyEmail:
 
         # Send the email
         fm = FastMail(conf)
-        await fm.send_message(message)
+        with tracing.span("email.send", kind=tracing.CLIENT, **{"net.peer.name": settings.EMAIL_HOST}):
+            await fm.send_message(message)
 
     async def sendVerificationCode(self):
         await self.sendMail('Your verification code', 'verification')
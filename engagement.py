@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from config import settings
+
+PLATFORMS = ("tiktok", "youtube", "twitter", "facebook", "instagram")
+# how many recent batch ids each document remembers, so a replayed increment is skipped
+MARKER_HISTORY = 20
+# a batch stuck "applying" this long (the worker died) may be claimed again
+LEASE_SECONDS = 60
+GRANULARITIES = ("hour", "day")
+# points committed slightly after a rollup read them are picked up by the next one
+ROLLUP_MARGIN = timedelta(minutes=1)
+
+
+class BatchConflict(Exception):
+    pass
+
+
+class BatchInProgress(Exception):
+    pass
+
+
+def fingerprint(records: list) -> str:
+    return hashlib.sha256(json.dumps(records, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def plan(records: list):
+    """Validates records and merges them into one update per document.
+
+    Returns per-record results (None where still pending) and, for users and
+    videos, {ObjectId: (counts, links, [record indexes])}.
+    """
+    results = [None] * len(records)
+    users = {}
+    videos = {}
+    for index, record in enumerate(records):
+        links = {platform: record[platform] for platform in PLATFORMS if record.get(platform) is not None}
+        try:
+            if bool(record.get("user_id")) == bool(record.get("video_id")):
+                raise ValueError("Exactly one of user_id or video_id is required")
+            if record.get("platform") is not None and record["platform"] not in PLATFORMS:
+                raise ValueError(f"Platform must be one of {', '.join(PLATFORMS)}")
+            if record.get("user_id"):
+                if links:
+                    raise ValueError("Platform links belong to videos")
+                if not (record.get("views") or record.get("likes")):
+                    raise ValueError("Nothing to update")
+                targets = users
+                key = ObjectId(record["user_id"])
+            else:
+                if not (links or record.get("views") or record.get("likes")):
+                    raise ValueError("Nothing to update")
+                targets = videos
+                key = ObjectId(record["video_id"])
+        except (InvalidId, TypeError):
+            results[index] = {"index": index, "status": "invalid", "error": "Invalid id"}
+            continue
+        except ValueError as error:
+            results[index] = {"index": index, "status": "invalid", "error": str(error)}
+            continue
+        counts, merged_links, indexes = targets.setdefault(key, ({"views": 0, "likes": 0}, {}, []))
+        counts["views"] += record.get("views") or 0
+        counts["likes"] += record.get("likes") or 0
+        merged_links.update(links)
+        indexes.append(index)
+    return results, users, videos
+
+
+def claim(batches, batch_id: str, digest: str):
+    # Returns (stored summary when the batch was already applied, when the batch was first claimed)
+    now = datetime.utcnow()
+    try:
+        batches.insert_one({"_id": batch_id, "fingerprint": digest, "status": "applying", "created_at": now, "claimed_at": now})
+        return None, now
+    except DuplicateKeyError:
+        pass
+    existing = batches.find_one({"_id": batch_id})
+    if existing["fingerprint"] != digest:
+        raise BatchConflict("This batch id was already used for different records")
+    if existing["status"] == "applied":
+        return existing["summary"], existing["created_at"]
+    reclaimed = batches.find_one_and_update(
+        {"_id": batch_id, "status": "applying", "claimed_at": {"$lt": now - timedelta(seconds=LEASE_SECONDS)}},
+        {"$set": {"claimed_at": now}},
+    )
+    if not reclaimed:
+        raise BatchInProgress("This batch is still being applied")
+    return None, reclaimed["created_at"]
+
+
+def build_update(batch_id: str, key: ObjectId, counts: dict, links: dict) -> UpdateOne | None:
+    update = {}
+    if counts["views"] or counts["likes"]:
+        update["$inc"] = counts
+        update["$push"] = {"engagement_batches": {"$each": [batch_id], "$slice": -MARKER_HISTORY}}
+    if links:
+        update["$set"] = links
+    if not update:
+        # increments that cancel out within the batch
+        return None
+    # the marker makes a retried batch skip documents it already counted
+    return UpdateOne({"_id": key, "engagement_batches": {"$ne": batch_id}}, update)
+
+
+def apply(batches, users, videos, series, meta, batch_id: str, records: list) -> dict:
+    """Applies a batch of engagement records at most once per batch id.
+
+    Every applied view/like increment is also written to the `series`
+    time-series collection for history charts.  Points carry their batch id
+    and record index and are stamped with the batch's first claim, so those
+    rewritten by a reclaimed batch land in the same bucket as the originals
+    and are counted once (see point_identity).
+    """
+    digest = fingerprint(records)
+    summary, claimed_at = claim(batches, batch_id, digest)
+    if summary is not None:
+        return {**summary, "replayed": True}
+
+    results, user_updates, video_updates = plan(records)
+    points = []
+    for collection, updates in ((users, user_updates), (videos, video_updates)):
+        if not updates:
+            continue
+        # no upserts: a typo'd id must not create a stub user or video
+        found = {row["_id"]: row for row in collection.find({"_id": {"$in": list(updates)}}, {"creator": 1})}
+        operations = []
+        owners = []
+        for key, (counts, links, indexes) in updates.items():
+            if key not in found:
+                for index in indexes:
+                    results[index] = {"index": index, "status": "not_found"}
+                continue
+            operation = build_update(batch_id, key, counts, links)
+            if operation is None:
+                for index in indexes:
+                    results[index] = {"index": index, "status": "applied"}
+                continue
+            operations.append(operation)
+            owners.append((found[key], indexes))
+        failed = {}
+        if operations:
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as error:
+                failed = {write_error["index"]: write_error["errmsg"] for write_error in error.details["writeErrors"]}
+        for position, (doc, indexes) in enumerate(owners):
+            for index in indexes:
+                if position in failed:
+                    results[index] = {"index": index, "status": "error", "error": failed[position]}
+                    continue
+                results[index] = {"index": index, "status": "applied"}
+                record = records[index]
+                if record.get("views") or record.get("likes"):
+                    points.append({
+                        "ts": claimed_at,
+                        "batch": batch_id,
+                        "record": index,
+                        "meta": {
+                            "creator": doc.get("creator", doc["_id"]),
+                            "video": doc["_id"] if collection is videos else None,
+                            "platform": record.get("platform"),
+                        },
+                        "views": record.get("views") or 0,
+                        "likes": record.get("likes") or 0,
+                    })
+    if points:
+        series.insert_many(points, ordered=False)
+        # a reclaimed batch writes points older than the last rollup; make the next one recompute them
+        if claimed_at < datetime.utcnow() - ROLLUP_MARGIN:
+            meta.update_one({"engagement_rolled_at": {"$gt": claimed_at}}, {"$set": {"engagement_rolled_at": claimed_at}})
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    summary = {"batch_id": batch_id, "counts": counts, "results": results}
+    batches.update_one(
+        {"_id": batch_id},
+        {"$set": {"status": "applied", "summary": summary, "applied_at": datetime.utcnow()}},
+    )
+    return {**summary, "replayed": False}
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+def point_identity() -> list:
+    # A reclaimed batch rewrites the points of records it already counted; keep
+    # one per (batch, record).  Duplicates share ts, so they fall in the same window.
+    return [
+        {"$group": {
+            "_id": {"b": "$batch", "r": "$record"},
+            "ts": {"$first": "$ts"},
+            "meta": {"$first": "$meta"},
+            "views": {"$first": "$views"},
+            "likes": {"$first": "$likes"},
+        }},
+    ]
+
+
+def rollup_pipeline(start: datetime, granularity: str, into: str) -> list:
+    # Recomputes every bucket from `start` on from raw points and replaces the
+    # stored ones, so running it twice (or from two workers) is harmless.
+    return [
+        {"$match": {"ts": {"$gte": start}}},
+        *point_identity(),
+        {"$group": {
+            "_id": {
+                "c": "$meta.creator",
+                "v": "$meta.video",
+                "p": "$meta.platform",
+                "t": {"$dateTrunc": {"date": "$ts", "unit": granularity}},
+            },
+            "views": {"$sum": "$views"},
+            "likes": {"$sum": "$likes"},
+        }},
+        {"$set": {"creator": "$_id.c", "video": "$_id.v", "platform": "$_id.p", "t": "$_id.t"}},
+        {"$merge": {"into": into, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def rollup(series, rollups: dict, meta):
+    # rollups: {"hour": collection, "day": collection}
+    started = datetime.utcnow()
+    state = meta.find_one({}, {"engagement_rolled_at": 1}) or {}
+    rolled_at = state.get("engagement_rolled_at") or started - timedelta(days=settings.ENGAGEMENT_RAW_DAYS)
+    for granularity in GRANULARITIES:
+        series.aggregate(rollup_pipeline(truncate(rolled_at, granularity), granularity, rollups[granularity].name))
+    # only if no reclaimed batch moved it back meanwhile; otherwise the next run covers those points
+    meta.update_one(
+        {"engagement_rolled_at": state.get("engagement_rolled_at")},
+        {"$set": {"engagement_rolled_at": started - ROLLUP_MARGIN}},
+    )
+
+
+async def rollup_forever(series, rollups: dict, meta):
+    while True:
+        try:
+            await asyncio.to_thread(rollup, series, rollups, meta)
+        except Exception as error:
+            print(f"Engagement rollup failed: {error}")
+        await asyncio.sleep(settings.ENGAGEMENT_ROLLUP_SECONDS)
+
+
+def history(series, rollups: dict, meta, match: dict, granularity: str, start: datetime, end: datetime) -> list:
+    """Views and likes per bucket between start and end.
+
+    Complete buckets come from the rollup collection; the few since the last
+    rollup are summed from raw points, so the cost does not grow with history.
+    Pass meta from the same handle as the rollups: a boundary read from the
+    primary can be ahead of what a lagging secondary has rolled up.
+    """
+    state = meta.find_one({}, {"engagement_rolled_at": 1}) or {}
+    boundary = truncate(state.get("engagement_rolled_at") or start, granularity)
+    buckets = {}
+    if start < boundary:
+        rolled = rollups[granularity].aggregate([
+            {"$match": {**match, "t": {"$gte": truncate(start, granularity), "$lt": min(boundary, end)}}},
+            {"$group": {"_id": "$t", "views": {"$sum": "$views"}, "likes": {"$sum": "$likes"}}},
+        ])
+        for row in rolled:
+            buckets[row["_id"]] = row
+    if end > boundary:
+        raw_match = {f"meta.{field}": value for field, value in match.items()}
+        recent = series.aggregate([
+            {"$match": {**raw_match, "ts": {"$gte": max(boundary, start), "$lt": end}}},
+            *point_identity(),
+            {"$group": {
+                "_id": {"$dateTrunc": {"date": "$ts", "unit": granularity}},
+                "views": {"$sum": "$views"},
+                "likes": {"$sum": "$likes"},
+            }},
+        ])
+        for row in recent:
+            buckets[row["_id"]] = row
+    return [
+        {"t": bucket, "views": buckets[bucket]["views"], "likes": buckets[bucket]["likes"]}
+        for bucket in sorted(buckets)
+    ]
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config import settings
+from utils import WORKER_ID
+
+# Change streams need a replica set; standalone servers answer with this code
+CHANGE_STREAMS_UNSUPPORTED = 40573
+RESET = {"id": None, "kind": "reset", "data": {}}
+
+
+class EventBus:
+    """In-process pub/sub for video events.
+
+    Keeps the last EVENTS_HISTORY events so reconnecting clients can resume
+    from their last event id.  A subscriber that falls QUEUE_SIZE events
+    behind is sent a reset and dropped instead of buffering without bound.
+    """
+
+    QUEUE_SIZE = 256
+
+    def __init__(self, history: int):
+        self.history = deque(maxlen=history)
+        self.subscribers = set()
+        # True once this worker is watching the shared events collection
+        self.fanout = False
+
+    def dispatch(self, event: dict):
+        self.history.append(event)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET)
+                self.subscribers.discard(queue)
+
+    def since(self, last_id: str) -> list | None:
+        for index, event in enumerate(self.history):
+            if event["id"] == last_id:
+                return list(self.history)[index + 1:]
+        return None
+
+    @contextmanager
+    def subscribe(self):
+        queue = asyncio.Queue(self.QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers.discard(queue)
+
+
+bus = EventBus(settings.EVENTS_HISTORY)
+
+
+def publish(collection, kind: str, data: dict):
+    # Delivers to this worker's subscribers right away; other workers get the
+    # event through the change stream on the shared collection.
+    event_id = ObjectId()
+    event = {"id": str(event_id), "kind": kind, "data": data}
+    bus.dispatch(event)
+    if bus.fanout:
+        collection.insert_one({
+            "_id": event_id,
+            "kind": kind,
+            "data": data,
+            "worker": WORKER_ID,
+            "created_at": datetime.utcnow(),
+        })
+    return event
+
+
+def replay(collection, last_id: str | None) -> list | None:
+    # Events after last_id, or None when they can no longer be recovered
+    if not last_id:
+        return []
+    events = bus.since(last_id)
+    if events is not None or not bus.fanout:
+        return events
+    try:
+        last = ObjectId(last_id)
+    except InvalidId:
+        return None
+    # the capped collection may already have dropped it
+    if not collection.find_one({"_id": last}, {"_id": 1}):
+        return None
+    rows = collection.find({"_id": {"$gt": last}}).sort("_id", 1).limit(settings.EVENTS_HISTORY)
+    return [{"id": str(row["_id"]), "kind": row["kind"], "data": row["data"]} for row in rows]
+
+
+def watch(collection, loop, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            with collection.watch([{"$match": {"operationType": "insert"}}], max_await_time_ms=1000) as stream:
+                bus.fanout = True
+                while not stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    row = change["fullDocument"]
+                    if row["worker"] != WORKER_ID:
+                        event = {"id": str(row["_id"]), "kind": row["kind"], "data": row["data"]}
+                        loop.call_soon_threadsafe(bus.dispatch, event)
+        except OperationFailure as error:
+            bus.fanout = False
+            if error.code == CHANGE_STREAMS_UNSUPPORTED:
+                print("Change streams unavailable, video events stay within each worker")
+                return
+            print(f"Event change stream failed: {error}")
+            time.sleep(1)
+        except PyMongoError as error:
+            bus.fanout = False
+            if stop.is_set():
+                break
+            print(f"Event change stream failed: {error}")
+            time.sleep(1)
+    bus.fanout = False
+
+
+async def watch_forever(collection):
+    stop = threading.Event()
+    try:
+        await asyncio.to_thread(watch, collection, asyncio.get_running_loop(), stop)
+    finally:
+        stop.set()
+
+
+async def stream(collection, last_id: str | None, keepalive: float = 15):
+    """Replays missed events, then yields live ones until the subscriber is reset."""
+    with bus.subscribe() as queue:
+        backlog = await asyncio.to_thread(replay, collection, last_id)
+        if backlog is None:
+            yield RESET
+            backlog = []
+        replayed = {event["id"] for event in backlog}
+        for event in backlog:
+            yield event
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event["id"] in replayed:
+                continue
+            yield event
+            if event is RESET:
+                return
+
+
+def sse(event: dict | None) -> str:
+    if event is None:
+        return ": keepalive\n\n"
+    lines = f"event: {event['kind']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    if event["id"]:
+        lines = f"id: {event['id']}\n{lines}"
+    return lines
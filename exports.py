@@ -0,0 +1,199 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from config import settings
+
+# bytes buffered before a chunk is handed to the response
+CHUNK_SIZE = 64 * 1024
+# Excel's last row number; each sheet repeats the header in row 1
+SHEET_ROWS = 1_048_576
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def batches(cursor):
+    # one EXPORT_BATCH_SIZE batch of rows in memory at a time, so callers can look up related documents per batch
+    batch = []
+    for row in cursor.batch_size(settings.EXPORT_BATCH_SIZE):
+        batch.append(row)
+        if len(batch) == settings.EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, (list, tuple)):
+        return " ".join(text(item) for item in value)
+    return str(value)
+
+
+def csv_cell(value):
+    # Spreadsheets run cells starting with these as formulas; names and titles are user input
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    value = text(value)
+    return f"'{value}" if value.startswith(FORMULA_PREFIXES) else value
+
+
+def csv_stream(columns: list, rows):
+    """CSV bytes in CHUNK_SIZE pieces; rows yields lists matching columns."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # the BOM makes Excel read the file as UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([csv_cell(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class Sink:
+    # Write-only, unseekable: zipfile then writes data descriptors instead of
+    # seeking back, so the archive can be streamed as it is produced
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def column_name(index: int) -> str:
+    # 0 -> A, 25 -> Z, 26 -> AA
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def xlsx_cell(reference: str, value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    value = XML_ILLEGAL.sub("", text(value))
+    if not value:
+        return ""
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+def xlsx_row(number: int, values: list) -> str:
+    cells = "".join(xlsx_cell(f"{column_name(index)}{number}", value) for index, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = "</sheetData></worksheet>"
+
+
+def xlsx_package(sheets: int) -> dict:
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for n in range(1, sheets + 1)
+    )
+    sheet_list = "".join(f'<sheet name="Sheet{n}" sheetId="{n}" r:id="rId{n}"/>' for n in range(1, sheets + 1))
+    relations = "".join(
+        f'<Relationship Id="rId{n}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{n}.xml"/>'
+        for n in range(1, sheets + 1)
+    )
+    return {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f"{overrides}</Types>"
+        ),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ),
+        "xl/workbook.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f"<sheets>{sheet_list}</sheets></workbook>"
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f"{relations}</Relationships>"
+        ),
+    }
+
+
+def xlsx_stream(columns: list, rows):
+    """A minimal XLSX workbook streamed as it is written.
+
+    Worksheets are deflated straight into the response; a new sheet starts
+    every SHEET_ROWS rows.  The workbook parts that list the sheets go last,
+    once their number is known (a zip's member order does not matter).
+    """
+    sink = Sink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+    sheets = 0
+    sheet = None
+    number = 0
+    for row in rows:
+        if sheet is None or number > SHEET_ROWS:
+            if sheet is not None:
+                sheet.write(SHEET_END.encode())
+                sheet.close()
+            sheets += 1
+            sheet = archive.open(f"xl/worksheets/sheet{sheets}.xml", "w", force_zip64=True)
+            sheet.write((SHEET_START + xlsx_row(1, columns)).encode())
+            number = 2
+        sheet.write(xlsx_row(number, row).encode())
+        number += 1
+        if sink.size >= CHUNK_SIZE:
+            yield sink.drain()
+    if sheet is None:
+        sheets = 1
+        sheet = archive.open("xl/worksheets/sheet1.xml", "w")
+        sheet.write((SHEET_START + xlsx_row(1, columns)).encode())
+    sheet.write(SHEET_END.encode())
+    sheet.close()
+    for name, content in xlsx_package(sheets).items():
+        archive.writestr(name, content)
+    archive.close()
+    yield sink.drain()
+
+
+FORMATS = {
+    "csv": (csv_stream, "text/csv"),
+    "xlsx": (xlsx_stream, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from config import settings
+from shared_cache import MISSING, cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller bodies are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+# version tokens only change on touch(); the TTL just has to outlive any response cache
+VERSION_TTL = 7 * 24 * 3600
+
+
+def version(scope: str) -> str:
+    # A random token per scope in the shared cache, so every worker agrees.
+    # An evicted token is simply replaced, which only costs one refetch.
+    token = cache.get(f"version:{scope}")
+    if token is MISSING:
+        token = secrets.token_hex(8)
+        cache.set(f"version:{scope}", token, VERSION_TTL)
+    return token
+
+
+def touch(*scopes: str):
+    """Marks data in scopes as changed, so cached responses built from it are revalidated."""
+    for scope in scopes:
+        cache.set(f"version:{scope}", secrets.token_hex(8), VERSION_TTL)
+
+
+class Encoded:
+    def __init__(self, body: bytes):
+        self.bodies = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=5)
+
+    def pick(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return "identity"
+
+
+class ResponseCache:
+    """Serialized, precompressed response bodies per worker, keyed by ETag."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, etag: str) -> Encoded | None:
+        with self.lock:
+            entry = self.entries.get(etag)
+            if entry is not None:
+                self.entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag: str, entry: Encoded):
+        with self.lock:
+            self.entries[etag] = entry
+            self.entries.move_to_end(etag)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+responses = ResponseCache(settings.RESPONSE_CACHE_ENTRIES)
+
+
+def entity_tag(key: str, scopes: tuple, ttl: float) -> str:
+    # Changes whenever a scope is touched, the shared cache is bumped, or
+    # the ttl window rolls over, so staleness is bounded like cached() data
+    parts = [key, str(cache.generation()), str(int(time.time() // ttl))]
+    parts += [version(scope) for scope in scopes]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+def matches(if_none_match: str, etag: str) -> bool:
+    # compression suffixes name the same data, so any variant matches
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/").strip('"')
+        if candidate == "*" or candidate.split("-")[0] == etag:
+            return True
+    return False
+
+
+def cached_response(request: Request, key: str, scopes: tuple, ttl: float, load) -> Response:
+    """Serves load()'s JSON with a strong ETag, answering 304 when the client is current.
+
+    key must identify everything the payload depends on besides the data in
+    scopes (the user, query parameters...).  load() only runs when this
+    worker has no body for the current ETag; repeat requests cost neither
+    serialization nor compression.
+    """
+    etag = entity_tag(key, scopes, ttl)
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": f'"{etag}"'})
+    entry = responses.get(etag)
+    if entry is None:
+        entry = Encoded(JSONResponse(jsonable_encoder(load())).body)
+        responses.put(etag, entry)
+    encoding = entry.pick(request.headers.get("accept-encoding", ""))
+    if encoding == "identity":
+        headers["ETag"] = f'"{etag}"'
+    else:
+        headers["ETag"] = f'"{etag}-{encoding}"'
+        headers["Content-Encoding"] = encoding
+    return Response(entry.bodies[encoding], media_type="application/json", headers=headers)
@@ -1,16 +1,57 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
 from config import settings
-from routers import auth, user, video, stats
+from admission import AdmissionMiddleware
+from tracing import TracingMiddleware
+from profiling import ProfilingMiddleware
+import tracing
+import database
+import engagement
+import events
+import trending
+import upload_gc
+from routers import auth, user, video, stats, dashboard, export
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bootstrap in the background so the worker starts serving right away;
+    # /ready reports when the database side is done.
+    app.state.bootstrap = asyncio.create_task(database.connect())
+    app.state.trending = asyncio.create_task(trending.sync_forever(database.Trending))
+    app.state.events = asyncio.create_task(events.watch_forever(database.Events))
+    app.state.engagement = asyncio.create_task(engagement.rollup_forever(
+        database.Engagement,
+        {"hour": database.EngagementHourly, "day": database.EngagementDaily},
+        database.Meta,
+    ))
+    app.state.upload_gc = asyncio.create_task(upload_gc.collect_forever(database.Video, database.Meta, database.Jobs))
+    yield
+    tasks = [app.state.upload_gc, app.state.engagement, app.state.events, app.state.trending, app.state.bootstrap]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    database.client.close()
+    database.analytics_client.close()
+    await asyncio.to_thread(tracing.exporter.shutdown)
+
 
 origins = [settings.CLIENT_ORIGIN, "http://localhost:3000", "https://main.dhizbzme1ajly.amplifyapp.com"]
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# innermost, so a profile covers the handler rather than time queued for admission
+app.add_middleware(ProfilingMiddleware)
+# added first so it sits inside CORS and shed responses still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+# outside admission, so time spent queued or shed shows up in the trace
+app.add_middleware(TracingMiddleware)
 app.add_middleware(CORSMiddleware, allow_origins=origins,
                    allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
@@ -18,10 +59,19 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(user.router, prefix="/api/users", tags=["Users"])
 app.include_router(video.router, prefix="/api/videos", tags=["Videos"])
 app.include_router(stats.router, prefix="/api/stats", tags=["Stats"])
+app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
+app.include_router(export.router, prefix="/api/export", tags=["Export"])
 
 @app.get("/")
 async def health_checker():
     return {"status": "success"}
 
+@app.get("/ready")
+async def readiness_checker(response: Response):
+    if not app.state.bootstrap.done() or not await database.ping():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting"}
+    return {"status": "ready"}
+
 if __name__ == '__main__':
     uvicorn.run("main:app", reload=True, host="0.0.0.0", port=9000)
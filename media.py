@@ -0,0 +1,157 @@
+import struct
+
+# Boxes we descend into; everything else is either parsed whole or skipped.
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+LEAVES = {b"ftyp", b"mvhd", b"tkhd", b"mdhd", b"hdlr", b"stsd"}
+# What an MP4 or QuickTime file may legitimately start with
+FIRST_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+MAX_LEAF_SIZE = 1024 * 1024
+
+
+class InvalidMedia(Exception):
+    pass
+
+
+class Mp4Probe:
+    """Incremental MP4/MOV box parser.
+
+    Feed it the upload chunk by chunk; it keeps only the bytes of the box it
+    is currently reading (headers and small metadata boxes), skips media
+    data by counting, and raises InvalidMedia as soon as the stream stops
+    looking like an ISO base media file.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.skip = 0
+        self.containers = []
+        self.size = 0
+        self.brand = None
+        self.timescale = None
+        self.duration = None
+        self.tracks = []
+        self.track = None
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.skip >= len(chunk):
+            self.skip -= len(chunk)
+            self.position += len(chunk)
+            return
+        self.buffer += chunk
+        while self.step():
+            pass
+
+    def consume(self, count: int):
+        del self.buffer[:count]
+        self.position += count
+
+    def step(self) -> bool:
+        if self.skip:
+            count = min(self.skip, len(self.buffer))
+            self.consume(count)
+            self.skip -= count
+            if self.skip:
+                return False
+
+        while self.containers and self.position >= self.containers[-1][1]:
+            self.containers.pop()
+            if not any(kind == b"trak" for kind, _ in self.containers):
+                self.track = None
+
+        if len(self.buffer) < 8:
+            return False
+        size, kind = struct.unpack(">I4s", self.buffer[:8])
+        header = 8
+        if size == 1:
+            if len(self.buffer) < 16:
+                return False
+            size = struct.unpack(">Q", self.buffer[8:16])[0]
+            header = 16
+
+        if self.position == 0 and kind not in FIRST_BOXES:
+            raise InvalidMedia("Not an MP4 or QuickTime file")
+        if size == 0:
+            # box runs to the end of the file, nothing after it to parse
+            self.consume(header)
+            self.skip = float("inf")
+            return True
+        if size < header:
+            raise InvalidMedia(f"Corrupt {kind!r} box at offset {self.position}")
+
+        if kind in CONTAINERS:
+            if kind == b"trak":
+                self.track = {}
+                self.tracks.append(self.track)
+            self.containers.append((kind, self.position + size))
+            self.consume(header)
+            return True
+
+        if kind in LEAVES and size <= MAX_LEAF_SIZE:
+            if len(self.buffer) < size:
+                return False
+            try:
+                self.parse(kind, bytes(self.buffer[header:size]))
+            except (IndexError, struct.error):
+                raise InvalidMedia(f"Truncated {kind.decode('latin-1')!r} box at offset {self.position}")
+            self.consume(size)
+            return True
+
+        self.consume(header)
+        self.skip = size - header
+        return True
+
+    def parse(self, kind: bytes, payload: bytes):
+        if kind == b"ftyp":
+            self.brand = payload[:4].decode("latin-1").strip()
+        elif kind == b"mvhd":
+            if payload[0] == 1:
+                self.timescale, self.duration = struct.unpack(">IQ", payload[20:32])
+            else:
+                self.timescale, self.duration = struct.unpack(">II", payload[12:20])
+        elif self.track is None:
+            return
+        elif kind == b"tkhd":
+            offset = 4 + (32 if payload[0] == 1 else 20) + 52
+            width, height = struct.unpack(">II", payload[offset:offset + 8])
+            self.track["width"] = width >> 16
+            self.track["height"] = height >> 16
+        elif kind == b"mdhd":
+            if payload[0] == 1:
+                timescale, duration = struct.unpack(">IQ", payload[20:32])
+            else:
+                timescale, duration = struct.unpack(">II", payload[12:20])
+            if timescale:
+                self.track["duration"] = duration / timescale
+        elif kind == b"hdlr":
+            self.track["handler"] = payload[8:12].decode("latin-1")
+        elif kind == b"stsd" and len(payload) >= 16:
+            self.track["codec"] = payload[12:16].decode("latin-1").strip()
+            if self.track.get("handler") == "vide" and len(payload) >= 44:
+                # visual sample entry: width and height after 24 bytes of fixed fields
+                width, height = struct.unpack(">HH", payload[40:44])
+                self.track.setdefault("width", width)
+                self.track.setdefault("height", height)
+
+    def result(self) -> dict:
+        # Called at end of stream: every declared box must have been read in full
+        while self.containers and self.position >= self.containers[-1][1]:
+            self.containers.pop()
+        if (self.skip and self.skip != float("inf")) or self.buffer or self.containers:
+            raise InvalidMedia(f"Truncated file: ended at offset {self.size} inside a box")
+        if self.timescale is None:
+            raise InvalidMedia("No movie header found")
+        video = next((t for t in self.tracks if t.get("handler") == "vide"), None)
+        audio = next((t for t in self.tracks if t.get("handler") == "soun"), None)
+        if video is None:
+            raise InvalidMedia("No video track found")
+        return {
+            "container": self.brand or "qt",
+            "duration": round(self.duration / self.timescale, 3) if self.timescale else None,
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "video_codec": video.get("codec"),
+            "audio_codec": audio.get("codec") if audio else None,
+            "size": self.size,
+        }
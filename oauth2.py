@@ -1,7 +1,14 @@
 import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from typing import List
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from fastapi import Depends, HTTPException, status
-from fastapi_jwt_auth import AuthJWT
+from fastapi_jwt_auth import AuthJWT as BaseAuthJWT
+from fastapi_jwt_auth.exceptions import JWTDecodeError
 from pydantic import BaseModel
 from bson.objectid import ObjectId
 
@@ -24,11 +31,70 @@ class Settings(BaseModel):
         settings.JWT_PRIVATE_KEY).decode('utf-8')
 
 
-@AuthJWT.load_config
+@BaseAuthJWT.load_config
 def get_config():
     return Settings()
 
 
+# Parsed once; handing PyJWT the key object skips re-reading the PEM per decode
+PUBLIC_KEY = load_pem_public_key(Settings().authjwt_public_key.encode())
+
+
+class VerifiedTokens:
+    """Bounded LRU of tokens whose signature already checked out, until their exp."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: bytes):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, claims: dict, expires_at: float):
+        with self.lock:
+            self.entries[key] = (claims, expires_at)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+verified_tokens = VerifiedTokens(settings.JWT_CACHE_SIZE)
+
+
+class AuthJWT(BaseAuthJWT):
+    # jwt_required() plus get_jwt_subject() decode the same token three times
+    # per request; only the first one per token pays for the RSA check.
+    def _verified_token(self, encoded_token: str, issuer: str | None = None) -> dict:
+        key = hashlib.sha256(f"{issuer}:{encoded_token}".encode()).digest()
+        claims = verified_tokens.get(key)
+        if claims is not None:
+            return dict(claims)
+        try:
+            claims = jwt.decode(
+                encoded_token,
+                PUBLIC_KEY,
+                issuer=issuer,
+                audience=self._decode_audience,
+                leeway=self._decode_leeway,
+                algorithms=self._decode_algorithms or [self._algorithm],
+            )
+        except Exception as err:
+            raise JWTDecodeError(status_code=422, message=str(err))
+        if "exp" in claims:
+            verified_tokens.put(key, claims, claims["exp"] + self._decode_leeway)
+        return dict(claims)
+
+
 class NotVerified(Exception):
     pass
 
@@ -37,11 +103,13 @@ class UserNotFound(Exception):
     pass
 
 
-def require_user(Authorize: AuthJWT = Depends()):
+def require_user_doc(Authorize: AuthJWT = Depends()):
+    # Same checks as require_user, for handlers that need the whole user document
     try:
         Authorize.jwt_required()
         user_id = Authorize.get_jwt_subject()
-        user = userEntity(User.find_one({'_id': ObjectId(str(user_id))}))
+        db_user = User.find_one({'_id': ObjectId(str(user_id))})
+        user = userEntity(db_user)
 
         if not user:
             raise UserNotFound('User no longer exist')
@@ -63,4 +131,24 @@ def require_user(Authorize: AuthJWT = Depends()):
                 status_code=status.HTTP_401_UNAUTHORIZED, detail='Please verify your account')
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail='Token is invalid or has expired')
-    return user_id
+    return db_user
+
+
+def require_user(Authorize: AuthJWT = Depends()):
+    return str(require_user_doc(Authorize)['_id'])
+
+
+def require_admin(user: dict = Depends(require_user_doc)):
+    # require_user_doc, restricted to admins
+    if user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail='You have no permission to do this!')
+    return user
+
+
+def request_user_doc(request) -> dict | None:
+    # require_user_doc for code outside a route (middleware): None instead of a 401
+    try:
+        return require_user_doc(AuthJWT(request))
+    except Exception:
+        return None
@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from starlette.requests import Request
+
+import oauth2
+from config import settings
+from database import Profiles
+
+# a profiled request with nothing on any thread is awaiting I/O or a lock
+AWAITING = "[awaiting]"
+# frames from the bottom of a worker thread searched for the context it runs
+CONTEXT_DEPTH = 8
+# the stored flamegraph; the rarest stacks are dropped beyond this
+MAX_COLLAPSED_BYTES = 4 * 1024 * 1024
+
+current = contextvars.ContextVar("profile", default=None)
+labels = {}
+STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+
+def label(code) -> str:
+    # "get_dashboard_info (routers/stats.py:353)"; cached per code object
+    name = labels.get(code)
+    if name is None:
+        path = code.co_filename
+        if "site-packages" in path:
+            path = path.split("site-packages" + os.sep, 1)[1]
+        elif path.startswith(STDLIB):
+            path = path[len(STDLIB):]
+        elif path.startswith(os.getcwd()):
+            path = os.path.relpath(path)
+        name = labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return name
+
+
+def thread_cpu(ident: int) -> float | None:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+def frame_context(frame) -> contextvars.Context | None:
+    # anyio's worker holds the context in a local; concurrent.futures work
+    # items (asyncio.to_thread, database.concurrently) hold Context.run
+    local = frame.f_locals
+    for value in local.values():
+        if isinstance(value, contextvars.Context):
+            # an idle anyio worker still holds its last job's locals
+            future = local.get("future")
+            return None if future is not None and future.done() else value
+        call = getattr(value, "fn", None)
+        if isinstance(call, functools.partial):
+            call = call.func
+        owner = getattr(call, "__self__", None)
+        if isinstance(owner, contextvars.Context):
+            return owner
+    return None
+
+
+class Profile:
+    def __init__(self, scope: dict, trigger: str, user_id: ObjectId | None):
+        self.id = ObjectId()
+        self.scope = scope
+        self.trigger = trigger
+        self.user_id = user_id
+        self.loop_thread = threading.get_ident()
+        # the middleware's coroutine frame is on the loop thread's stack
+        # exactly while this request runs there
+        self.root = sys._getframe(1)
+        self.stacks = Counter()
+        self.samples = Counter()
+        self.cpu = 0.0
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.wall = None
+        self.status_code = None
+
+    def stack(self, ident: int, leaf) -> list | None:
+        frames = []
+        frame = leaf
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        if ident == self.loop_thread:
+            if self.root not in frames:
+                return None
+            return frames[:frames.index(self.root)]
+        for depth in range(len(frames) - 1, max(len(frames) - 1 - CONTEXT_DEPTH, -1), -1):
+            context = frame_context(frames[depth])
+            if context is not None:
+                return frames[:depth] if context.get(current) is self else None
+        return None
+
+    def sample(self, frames: dict, names: dict, cpu_deltas: dict, interval: float):
+        present = False
+        for ident, leaf in frames.items():
+            stack = self.stack(ident, leaf)
+            if stack is None:
+                continue
+            present = True
+            thread = "loop" if ident == self.loop_thread else names.get(ident, "thread")
+            self.stacks[";".join([thread, *(label(frame.f_code) for frame in reversed(stack))])] += 1
+            delta = cpu_deltas.get(ident)
+            # a thread that burned under half the interval was mostly blocked (socket, bcrypt lock, disk)
+            if delta is None or delta >= interval / 2:
+                self.samples["cpu"] += 1
+            else:
+                self.samples["blocked"] += 1
+            self.cpu += delta or 0
+        if not present:
+            self.stacks[AWAITING] += 1
+            self.samples["awaiting"] += 1
+
+    def collapsed(self) -> str:
+        # folded stacks, one "frame;frame;frame count" per line, for flamegraph.pl or speedscope
+        lines = []
+        size = 0
+        for stack, count in self.stacks.most_common():
+            line = f"{stack} {count}"
+            size += len(line) + 1
+            if size > MAX_COLLAPSED_BYTES:
+                break
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def document(self) -> dict:
+        route = self.scope.get("route")
+        return {
+            "_id": self.id,
+            "method": self.scope["method"],
+            "path": self.scope["path"],
+            "route": getattr(route, "path", None),
+            "status_code": self.status_code,
+            "trigger": self.trigger,
+            "user_id": self.user_id,
+            "interval_ms": settings.PROFILE_INTERVAL_MS,
+            "wall_ms": round(self.wall * 1000, 1),
+            # estimated from per-thread CPU clocks between samples
+            "cpu_ms": round(self.cpu * 1000, 1),
+            "samples": dict(self.samples),
+            "collapsed": self.collapsed(),
+            "created_at": self.started_at,
+        }
+
+
+class Sampler:
+    """One daemon thread sampling every thread's stack while any profile is active.
+
+    Stacks are attributed to a request by its frames on the loop thread or
+    by the contextvars.Context a worker thread is running, so concurrent
+    requests do not bleed into each other's profile.  Nothing runs while no
+    request is being profiled.
+    """
+
+    def __init__(self):
+        self.active = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self, profile: Profile) -> bool:
+        with self.lock:
+            if len(self.active) >= settings.PROFILE_MAX_ACTIVE:
+                return False
+            self.active.add(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return True
+
+    def stop(self, profile: Profile):
+        with self.lock:
+            self.active.discard(profile)
+
+    def run(self):
+        me = threading.get_ident()
+        interval = settings.PROFILE_INTERVAL_MS / 1000
+        last_cpu = {}
+        while True:
+            with self.lock:
+                active = list(self.active)
+                if not active:
+                    self.wake.clear()
+            if not active:
+                last_cpu = {}
+                self.wake.wait()
+                continue
+            time.sleep(interval)
+            frames = sys._current_frames()
+            frames.pop(me, None)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            cpu_deltas = {}
+            for ident in frames:
+                now = thread_cpu(ident)
+                if now is not None:
+                    if ident in last_cpu:
+                        cpu_deltas[ident] = now - last_cpu[ident]
+                    last_cpu[ident] = now
+            for profile in active:
+                profile.sample(frames, names, cpu_deltas, interval)
+            del frames
+
+
+sampler = Sampler()
+
+
+async def trigger(scope: dict) -> tuple[str, ObjectId | None] | None:
+    headers = dict(scope["headers"])
+    if headers.get(settings.PROFILE_HEADER.lower().encode()):
+        # only admins may ask; anyone else is served normally
+        user = await asyncio.to_thread(oauth2.request_user_doc, Request(scope))
+        if user and user.get("role") == "admin":
+            return "header", user["_id"]
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return "sampled", None
+    return None
+
+
+class ProfilingMiddleware:
+    """Profiles one request on demand: an admin's PROFILE_HEADER, or PROFILE_SAMPLE_RATE of traffic.
+
+    The response carries X-Profile-Id; the folded stacks and the CPU versus
+    wall breakdown are stored in Profiles for download through
+    /api/stats/profiles.  Sampled profiles faster than PROFILE_MIN_MS are
+    discarded, since the point is to catch the slow ones.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        reason = await trigger(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        profile = Profile(scope, *reason)
+        if not sampler.start(profile):
+            await self.app(scope, receive, send)
+            return
+        token = current.set(profile)
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            current.reset(token)
+            sampler.stop(profile)
+            profile.wall = time.perf_counter() - profile.started
+            if profile.trigger == "header" or profile.wall * 1000 >= settings.PROFILE_MIN_MS:
+                try:
+                    await asyncio.to_thread(Profiles.insert_one, profile.document())
+                except Exception as error:
+                    print(f"Saving profile failed: {error}")
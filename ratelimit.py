@@ -0,0 +1,138 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Policy:
+    def __init__(self, scope: str, capacity: int, period: float):
+        self.scope = scope
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, spec: str) -> list:
+        # "ip:20/minute,email:5/hour" -> one bucket per scope
+        policies = []
+        for part in filter(None, (part.strip() for part in spec.split(","))):
+            scope, _, limit = part.partition(":")
+            count, _, period = limit.partition("/")
+            policies.append(cls(scope.strip(), int(count), PERIODS[period.strip()]))
+        return policies
+
+
+class MemoryBackend:
+    """Token buckets in this worker's memory, evicting the stalest keys past max_keys."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key: str, policy: Policy, now: float):
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (policy.capacity, now))
+            tokens = min(policy.capacity, tokens + (now - updated) * policy.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / policy.rate
+
+
+class MongoBackend:
+    """Token buckets shared by every worker, refilled and spent in one atomic update."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, key: str, policy: Policy, now: float):
+        refill_seconds = policy.capacity / policy.rate
+        pipeline = [
+            {"$set": {"tokens": {"$min": [
+                policy.capacity,
+                {"$add": [
+                    {"$ifNull": ["$tokens", policy.capacity]},
+                    {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, policy.rate]},
+                ]},
+            ]}}},
+            {"$set": {
+                "allowed": {"$gte": ["$tokens", 1]},
+                "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "updated": now,
+                # the bucket is full again by then, so the document can go
+                "expires_at": datetime.utcnow() + timedelta(seconds=refill_seconds),
+            }},
+        ]
+        for attempt in range(2):
+            try:
+                bucket = self.collection.find_one_and_update(
+                    {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # two workers upserted the same new key; the retry updates the winner's document
+                if attempt:
+                    raise
+        if bucket["allowed"]:
+            return True, 0
+        return False, (1 - bucket["tokens"]) / policy.rate
+
+
+POLICIES = {
+    "login": Policy.parse(settings.RATE_LIMIT_LOGIN),
+    "register": Policy.parse(settings.RATE_LIMIT_REGISTER),
+    "resetpassword": Policy.parse(settings.RATE_LIMIT_RESET_PASSWORD),
+}
+backend = None
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        if settings.RATE_LIMIT_BACKEND == "mongo":
+            from database import RateLimits
+
+            backend = MongoBackend(RateLimits)
+        else:
+            backend = MemoryBackend()
+    return backend
+
+
+def client_ip(request: Request) -> str:
+    # Behind N trusted proxies the client address is the Nth entry from the
+    # right of X-Forwarded-For; anything further left is client-supplied.
+    forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+    if settings.RATE_LIMIT_TRUSTED_PROXIES and len(forwarded) >= settings.RATE_LIMIT_TRUSTED_PROXIES:
+        return forwarded[-settings.RATE_LIMIT_TRUSTED_PROXIES]
+    return request.client.host if request.client else "unknown"
+
+
+def check(route: str, request: Request, email: str | None = None):
+    """Spend one token from every bucket configured for `route`, or raise 429."""
+    now = time.time()
+    values = {"ip": client_ip(request), "email": email.lower() if email else None}
+    retry_after = 0
+    for policy in POLICIES[route]:
+        if not values.get(policy.scope):
+            continue
+        allowed, wait = get_backend().take(f"{route}:{policy.scope}:{values[policy.scope]}", policy, now)
+        if not allowed:
+            retry_after = max(retry_after, wait)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
@@ -1,16 +1,21 @@
 from fastapi import APIRouter, HTTPException, status, Request, Response, Depends, Body
 from datetime import datetime, timedelta
 from random import randbytes
-import hashlib
 from pydantic import EmailStr
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from schemas import userSchemas
 from serializers.userSerializers import userEntity
 from emails.verifyEmail import VerifyEmail
 from emails.forgotEmail import ForgotEmail
-from database import User
+from database import User, VerificationTokens
 import utils
+import ratelimit
+import tokens
+import http_cache
+import user_search
 from oauth2 import AuthJWT, require_user
 from config import settings
 
@@ -21,12 +26,7 @@ REFRESH_TOKEN_EXPIRES_IN = settings.REFRESH_TOKEN_EXPIRES_IN
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def create_user(payload: userSchemas.CreateUserSchema, request: Request):
-    # Check if user already exist
-    user = User.find_one({"email": payload.email.lower()})
-    if user:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT, detail="Account already exist"
-        )
+    ratelimit.check("register", request)
     # Compare password and passwordConfirm
     if payload.password != payload.passwordConfirm:
         raise HTTPException(
@@ -39,30 +39,23 @@ async def create_user(payload: userSchemas.CreateUserSchema, request: Request):
     payload.created_at = datetime.utcnow()
     payload.updated_at = payload.created_at
 
-    result = User.insert_one(payload.dict())
-    new_user = User.find_one({"_id": result.inserted_id})
+    # The unique email index is the existence check, and insert_one fills in
+    # new_user["_id"], so there is nothing to read back.
+    new_user = payload.dict()
+    new_user.update(user_search.search_fields(new_user))
     try:
-        token = randbytes(10)
-        hashedCode = hashlib.sha256()
-        hashedCode.update(token)
-        verification_code = hashedCode.hexdigest()
-        User.find_one_and_update(
-            {"_id": result.inserted_id},
-            {
-                "$set": {
-                    "verification_code": verification_code,
-                    "updated_at": datetime.utcnow(),
-                }
-            },
+        User.insert_one(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Account already exist"
         )
-        # print(token.hex())
-        await VerifyEmail(userEntity(new_user), token.hex(), [EmailStr(payload.email)]).sendVerificationCode()
+    http_cache.touch("users")
+    try:
+        token = tokens.issue(VerificationTokens, new_user["_id"], tokens.VERIFY)
+        await VerifyEmail(userEntity(new_user), token, [EmailStr(payload.email)]).sendVerificationCode()
     except Exception as error:
         print(error)
-        User.find_one_and_update(
-            {"_id": result.inserted_id},
-            {"$set": {"verification_code": None, "updated_at": datetime.utcnow()}},
-        )
+        tokens.revoke(VerificationTokens, new_user["_id"], tokens.VERIFY)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error sending email",
@@ -76,9 +69,11 @@ async def create_user(payload: userSchemas.CreateUserSchema, request: Request):
 @router.post("/login")
 async def login(
     payload: userSchemas.LoginUserSchema,
+    request: Request,
     response: Response,
     Authorize: AuthJWT = Depends(),
 ):
+    ratelimit.check("login", request, payload.email)
     # Check if the user exist
     db_user = User.find_one({"email": payload.email.lower()})
     if not db_user:
@@ -221,22 +216,13 @@ async def logout(
 
 @router.patch("/verifyemail/{token}")
 async def verify_me(token: str, response: Response, Authorize: AuthJWT = Depends()):
-    hashedCode = hashlib.sha256()
-    hashedCode.update(bytes.fromhex(token))
-    verification_code = hashedCode.hexdigest()
-    db_user = User.find_one({"verification_code": verification_code})
-    result = User.find_one_and_update(
-        {"verification_code": verification_code},
-        {
-            "$set": {
-                "verification_code": None,
-                "verified": True,
-                "updated_at": datetime.utcnow(),
-            }
-        },
-        new=True,
+    user_id = tokens.consume(VerificationTokens, token, tokens.VERIFY)
+    db_user = user_id and User.find_one_and_update(
+        {"_id": user_id},
+        {"$set": {"verified": True, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
     )
-    if not result:
+    if not db_user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid verification code or account already verified",
@@ -294,7 +280,8 @@ async def verify_me(token: str, response: Response, Authorize: AuthJWT = Depends
 
 
 @router.patch("/resetpassword")
-async def reset_password(email: str = Body(..., embed=True)):
+async def reset_password(request: Request, email: str = Body(..., embed=True)):
+    ratelimit.check("resetpassword", request, email)
     user = User.find_one({"email": email})
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No account with this email.")
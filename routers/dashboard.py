@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends
+import asyncio
+import time
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+import oauth2
+from config import settings
+from serializers.userSerializers import userResponseEntity
+from routers.stats import marketeer_stats, creator_stats, load_dashboard_info
+from routers.video import downloadable_videos
+import shared_cache
+
+router = APIRouter()
+
+
+def sections_for(user: dict):
+    user_id = str(user["_id"])
+    if user["role"] == "marketeer":
+        return {
+            "stats": lambda: marketeer_stats(user),
+            "downloadable": lambda: downloadable_videos(user_id),
+        }
+    if user["role"] == "creator":
+        return {"stats": lambda: creator_stats(user)}
+    if user["role"] == "admin":
+        return {
+            "stats": lambda: shared_cache.cached(
+                "stats:admin", settings.STATS_CACHE_SECONDS, load_dashboard_info
+            )
+        }
+    return {}
+
+
+async def run_section(load, timeout: float):
+    # pymongo.timeout() makes the server give up too, instead of leaving the
+    # queries of a section we stopped waiting for running in the background
+    def bounded():
+        with pymongo.timeout(timeout):
+            return load()
+
+    started = time.perf_counter()
+    data, error = None, None
+    try:
+        data = await asyncio.wait_for(asyncio.to_thread(bounded), timeout)
+    except asyncio.TimeoutError:
+        error = "timeout"
+    except PyMongoError as exc:
+        print(f"Dashboard section failed: {exc}")
+        error = "timeout" if exc.timeout else "unavailable"
+    return data, error, round((time.perf_counter() - started) * 1000, 1)
+
+
+@router.get("", description="profile, stats and videos for the dashboard in one call")
+async def get_dashboard(user: dict = Depends(oauth2.require_user_doc)):
+    sections = sections_for(user)
+    results = await asyncio.gather(
+        *(run_section(load, settings.DASHBOARD_SECTION_TIMEOUT) for load in sections.values())
+    )
+
+    payload = {"status": "success", "user": userResponseEntity(user), "timings": {}, "errors": {}}
+    for name, (data, error, elapsed) in zip(sections, results):
+        payload[name] = data
+        payload["timings"][name] = elapsed
+        if error:
+            payload["errors"][name] = error
+    payload["partial"] = bool(payload["errors"])
+    return payload
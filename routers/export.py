@@ -0,0 +1,129 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+
+import oauth2
+import exports
+from database import AnalyticsUser, AnalyticsVideo
+from engagement import PLATFORMS
+
+router = APIRouter()
+
+USER_COLUMNS = ["id", "name", "email", "mobile", "role", "hashtag", "verified", "views", "likes", *PLATFORMS, "created_at"]
+VIDEO_COLUMNS = [
+    "id", "filename", "title", "brand", "hashtags", "creator_id", "creator_name",
+    "marketeer_id", "marketeer_name", "uploaded_at", "downloaded_at", "views", "likes", *PLATFORMS,
+]
+DOWNLOAD_COLUMNS = [
+    "video_id", "downloaded_at", "marketeer_id", "marketeer_name", "marketeer_email",
+    "creator_id", "creator_name", "hashtags", "filename",
+]
+
+
+def date_range(field: str, start: datetime | None, end: datetime | None) -> dict:
+    if not start and not end:
+        return {}
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {field: bounds}
+
+
+def user_names(batch: list, *fields: str) -> dict:
+    # one query per batch instead of a $lookup per row
+    ids = {row.get(field) for row in batch for field in fields} - {None}
+    return {row["_id"]: row for row in AnalyticsUser.find({"_id": {"$in": list(ids)}}, {"name": 1, "email": 1})}
+
+
+def export(kind: str, fmt: str, columns: list, rows):
+    stream, media_type = exports.FORMATS[fmt]
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    # a sync generator: Starlette pulls each chunk in the threadpool, so cursor
+    # reads never block the event loop and only one batch is held at a time
+    return StreamingResponse(
+        stream(columns, rows),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+@router.get("/users", description="streams users as CSV or XLSX")
+def export_users(
+    format: str = Query("csv", regex="^(csv|xlsx)$"),
+    role: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    admin: dict = Depends(oauth2.require_admin),
+):
+    query = date_range("created_at", created_from, created_to)
+    if role:
+        query["role"] = role
+    cursor = AnalyticsUser.find(query, {field: 1 for field in USER_COLUMNS if field != "id"}).sort("created_at", 1)
+
+    def rows():
+        for batch in exports.batches(cursor):
+            for user in batch:
+                yield [
+                    str(user["_id"]), user.get("name"), user.get("email"), user.get("mobile"), user.get("role"),
+                    user.get("hashtag"), user.get("verified"), user.get("views", 0), user.get("likes", 0),
+                    *(user.get(platform) for platform in PLATFORMS), user.get("created_at"),
+                ]
+
+    return export("users", format, USER_COLUMNS, rows())
+
+
+@router.get("/videos", description="streams videos as CSV or XLSX")
+def export_videos(
+    format: str = Query("csv", regex="^(csv|xlsx)$"),
+    uploaded_from: datetime | None = None,
+    uploaded_to: datetime | None = None,
+    admin: dict = Depends(oauth2.require_admin),
+):
+    query = date_range("uploaded_at", uploaded_from, uploaded_to)
+    cursor = AnalyticsVideo.find(query, {"media": 0, "engagement_batches": 0}).sort("uploaded_at", 1)
+
+    def rows():
+        for batch in exports.batches(cursor):
+            people = user_names(batch, "creator", "marketeer")
+            for video in batch:
+                creator = people.get(video.get("creator"), {})
+                marketeer = people.get(video.get("marketeer"), {})
+                yield [
+                    str(video["_id"]), video.get("filename"), video.get("title"), video.get("brand"), video.get("hashtags"),
+                    str(video.get("creator") or ""), creator.get("name"),
+                    str(video.get("marketeer") or ""), marketeer.get("name"),
+                    video.get("uploaded_at"), video.get("downloaded_at"), video.get("views", 0), video.get("likes", 0),
+                    *(video.get(platform) for platform in PLATFORMS),
+                ]
+
+    return export("videos", format, VIDEO_COLUMNS, rows())
+
+
+@router.get("/downloads", description="streams download history as CSV or XLSX")
+def export_downloads(
+    format: str = Query("csv", regex="^(csv|xlsx)$"),
+    downloaded_from: datetime | None = None,
+    downloaded_to: datetime | None = None,
+    admin: dict = Depends(oauth2.require_admin),
+):
+    query = {"downloaded_at": {"$ne": None, **date_range("downloaded_at", downloaded_from, downloaded_to).get("downloaded_at", {})}}
+    cursor = AnalyticsVideo.find(
+        query, {"downloaded_at": 1, "marketeer": 1, "creator": 1, "hashtags": 1, "filename": 1}
+    ).sort("downloaded_at", 1)
+
+    def rows():
+        for batch in exports.batches(cursor):
+            people = user_names(batch, "creator", "marketeer")
+            for video in batch:
+                creator = people.get(video.get("creator"), {})
+                marketeer = people.get(video.get("marketeer"), {})
+                yield [
+                    str(video["_id"]), video.get("downloaded_at"),
+                    str(video.get("marketeer") or ""), marketeer.get("name"), marketeer.get("email"),
+                    str(video.get("creator") or ""), creator.get("name"),
+                    video.get("hashtags"), video.get("filename"),
+                ]
+
+    return export("downloads", format, DOWNLOAD_COLUMNS, rows())
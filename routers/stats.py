@@ -1,59 +1,50 @@
-from fastapi import APIRouter, Depends, Body, HTTPException, status
+from fastapi import APIRouter, Depends, Body, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
 from bson import ObjectId
-from datetime import datetime, timedelta
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
 import calendar
 
 import oauth2
-from database import User, Video, Meta
-from serializers.userSerializers import userResponseEntity
+import database
+import engagement
+from database import User, Video, Meta, EngagementBatches, Engagement, Profiles
+# read-only aggregations go to secondaries; see database.analytics_client
+from database import (
+    AnalyticsUser,
+    AnalyticsVideo,
+    AnalyticsEngagement,
+    AnalyticsEngagementHourly,
+    AnalyticsEngagementDaily,
+    AnalyticsMeta,
+)
+from schemas.engagementSchemas import EngagementBatch
+from trending import trending
+from config import settings
+import shared_cache
+import http_cache
+import admission
+
+JACKPOT_CACHE_SECONDS = 3600
 
 router = APIRouter()
 
 
-@router.get("/marketeer", description="gets marketeer stats")
-def get_stats(user_id: str = Depends(oauth2.require_user)):
-    user = User.find_one({"_id": ObjectId(user_id)})
-
-    stats = {
-        "downloads": 0,
-        "month_downloads": 0,
-        "total_views": 0,
-        "total_likes": 0,
-        "first_posts": 0,
-    }
-    stats["downloads"] = Video.count_documents({"marketeer": ObjectId(user_id)})
-
-    start_date = datetime.utcnow().replace(
-        day=1, hour=0, minute=0, second=0, microsecond=0
-    )
-    end_date = datetime.utcnow()
-
-    # define the aggregation pipeline for monthly downloads
+def month_count(collection, field: str, user_id: ObjectId, start_date: datetime, end_date: datetime):
+    # define the aggregation pipeline for monthly uploads or downloads
     pipeline = [
         # filter the documents by the user ID and the date range
-        {
-            "$match": {
-                "marketeer": ObjectId(user_id),
-                "created_at": {"$gte": start_date, "$lte": end_date},
-            }
-        },
-        # project only the fields that we need (in this case just the post ID)
+        {"$match": {field: user_id, "created_at": {"$gte": start_date, "$lte": end_date}}},
         # group the documents by user ID and count the number of posts for each user
         {"$group": {"_id": None, "count": {"$sum": 1}}},
     ]
+    # execute the aggregation pipeline and retrieve the result
+    for row in collection.aggregate(pipeline):
+        return row["count"]
+    return 0
 
-    # execute the monthly downloads aggregation pipeline and retrieve the result
-    result = Video.aggregate(pipeline)
-    for row in result:
-        stats["month_downloads"] = row["count"]
-
-    stats["total_views"] = user["views"]
-    stats["total_likes"] = user["likes"]
-
-    # specify the start date and calculate the end date (40 days later)
-    start_date = user["created_at"]
-    end_date = start_date + timedelta(days=40)
 
+def first_posts(start_date: datetime, end_date: datetime):
     # construct the aggregation pipeline
     pipeline = [
         # match documents with created_at field within the specified period
@@ -61,63 +52,42 @@ def get_stats(user_id: str = Depends(oauth2.require_user)):
         # group by null to count the number of matching documents
         {"$group": {"_id": None, "count": {"$sum": 1}}},
     ]
+    for row in AnalyticsVideo.aggregate(pipeline):
+        return row["count"]
+    return 0
 
-    # execute the pipeline and retrieve the result
-    result = Video.aggregate(pipeline)
-
-    for row in result:
-        stats["first_posts"] = row["count"]
 
-    stats["days_left"] = (end_date - datetime.utcnow()).days
-
-    return {"status": "success", "stats": stats}
-
-
-@router.get("/creator", description="gets creator stats")
-def get_creator_stats(user_id: str = Depends(oauth2.require_user)):
-    user = userResponseEntity(User.find_one({"_id": ObjectId(user_id)}))
+def marketeer_stats(user: dict):
+    month_start = datetime.utcnow().replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    # specify the start date and calculate the end date (40 days later)
+    start_date = user["created_at"]
+    end_date = start_date + timedelta(days=40)
 
-    stats = {
-        "cash_prize_1": 2000,
-        "month_uploads": 0,
-        "total_uploads": 0,
-        "cash_prize_2": 0,
-        "ranking": 1,
-        "creators": 0,
-        "champions": [],
-        "uploads": 0,
-        "total_views": 0,
-        "total_likes": 0,
+    downloads, month_downloads, posts = database.concurrently(
+        lambda: AnalyticsVideo.count_documents({"marketeer": user["_id"]}),
+        lambda: month_count(AnalyticsVideo, "marketeer", user["_id"], month_start, datetime.utcnow()),
+        lambda: first_posts(start_date, end_date),
+    )
+    return {
+        "downloads": downloads,
+        "month_downloads": month_downloads,
+        "total_views": user["views"],
+        "total_likes": user["likes"],
+        "first_posts": posts,
+        "days_left": (end_date - datetime.utcnow()).days,
     }
-    stats["total_uploads"] = Video.count_documents({})
-    stats["creators"] = User.count_documents({"role": "creator"})
-    stats["jackpot"] = Meta.find_one({})["rewards"]
 
-    start_date = datetime.utcnow().replace(
-        day=1, hour=0, minute=0, second=0, microsecond=0
-    )
-    end_date = datetime.utcnow()
 
-    # define the aggregation pipeline for monthly uploads
-    pipeline = [
-        # filter the documents by the user ID and the date range
-        {
-            "$match": {
-                "creator": ObjectId(user_id),
-                "created_at": {"$gte": start_date, "$lte": end_date},
-            }
-        },
-        # project only the fields that we need (in this case just the post ID)
-        # group the documents by user ID and count the number of posts for each user
-        {"$group": {"_id": None, "count": {"$sum": 1}}},
-    ]
+@router.get("/marketeer", description="gets marketeer stats")
+def get_stats(user_id: str = Depends(oauth2.require_user)):
+    user = User.find_one({"_id": ObjectId(user_id)})
+    return {"status": "success", "stats": marketeer_stats(user)}
 
-    # execute the monthly uploads aggregation pipeline and retrieve the result
-    result = Video.aggregate(pipeline)
-    for row in result:
-        stats["month_uploads"] = row["count"]
 
-    result = Video.aggregate(
+def load_leaderboard():
+    result = AnalyticsVideo.aggregate(
         [
             {"$group": {"_id": "$creator", "count": {"$sum": 1}}},
             {
@@ -138,41 +108,158 @@ def get_creator_stats(user_id: str = Depends(oauth2.require_user)):
     champions = []
     for doc in result:
         champions.append({"creator": doc["user_info"]["name"], "uploads": doc["count"]})
-    stats["champions"] = champions
+    return {
+        "total_uploads": AnalyticsVideo.count_documents({}),
+        "creators": AnalyticsUser.count_documents({"role": "creator"}),
+        "champions": champions,
+    }
+
+
+def creator_stats(user: dict):
+    month_start = datetime.utcnow().replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    # Global figures are the same for every creator: shared across workers
+    leaderboard, jackpot, month_uploads, uploads = database.concurrently(
+        lambda: shared_cache.cached(
+            "stats:leaderboard", settings.STATS_CACHE_SECONDS, load_leaderboard
+        ),
+        lambda: shared_cache.cached(
+            "stats:jackpot", JACKPOT_CACHE_SECONDS, lambda: Meta.find_one({})["rewards"]
+        ),
+        lambda: month_count(AnalyticsVideo, "creator", user["_id"], month_start, datetime.utcnow()),
+        lambda: AnalyticsVideo.count_documents({"creator": user["_id"]}),
+    )
+    return {
+        "cash_prize_1": 2000,
+        "month_uploads": month_uploads,
+        "total_uploads": leaderboard["total_uploads"],
+        "cash_prize_2": 0,
+        "ranking": 1,
+        "creators": leaderboard["creators"],
+        "champions": leaderboard["champions"],
+        "uploads": uploads,
+        "total_views": user["views"],
+        "total_likes": user["likes"],
+        "jackpot": jackpot,
+    }
 
-    # define the aggregation pipeline for views and likes sumup
-    pipeline = [
-        # match documents belonging to the given user
-        {"$match": {"creator": ObjectId(user_id)}},
-        # group by null and sum up the likes count
-        {"$group": {"_id": None, "uploads": {"$sum": 1}}},
-    ]
 
-    stats["total_views"] = user["views"]
-    stats["total_likes"] = user["likes"]
-    stats["uploads"] = Video.count_documents({"creator": ObjectId(user_id)})
+@router.get("/creator", description="gets creator stats")
+def get_creator_stats(request: Request, user_id: str = Depends(oauth2.require_user)):
+    return http_cache.cached_response(
+        request, f"stats:creator:{user_id}", ("users", "videos"), settings.STATS_CACHE_SECONDS,
+        lambda: {"status": "success", "stats": creator_stats(User.find_one({"_id": ObjectId(user_id)}))},
+    )
 
-    return {"status": "success", "stats": stats}
+
+@router.get("/trending", description="gets trending hashtags")
+def get_trending(
+    limit: int = Query(10, ge=1, le=50), user_id: str = Depends(oauth2.require_user)
+):
+    # Served from the snapshot merged across workers by trending.sync_forever
+    return {
+        "status": "success",
+        "trending": {
+            "uploads": trending.top("uploads", limit),
+            "claims": trending.top("claims", limit),
+        },
+        "updated_at": trending.snapshot_at,
+    }
 
 
 @router.post("/jackpot")
 async def update_jackpot(jackpot: int = Body(..., embed=True)):
     Meta.update_one({}, {"$set": {"rewards": jackpot}})
+    # bump rather than delete so a read racing this update can't re-cache the old value
+    shared_cache.cache.bump()
     return {"state": "success"}
 
 
-@router.get("/admin", description="gets dashboard info")
-async def get_dashboard_info(user_id: str = Depends(oauth2.require_user)):
+def month_performance(year: int, month: int):
+    start_date = datetime(year, month, 1)
+    end_date = datetime(
+        year, month, calendar.monthrange(year, month)[1], 23, 59, 59, 99
+    )
+    unit_uploads = AnalyticsVideo.count_documents(
+        {"created_at": {"$gte": start_date, "$lte": end_date}}
+    )
+    unit_downloads = AnalyticsVideo.count_documents(
+        {
+            "created_at": {"$gte": start_date, "$lte": end_date},
+            "marketeer": {"$ne": None},
+        }
+    )
+    new_marketeers = AnalyticsUser.count_documents(
+        {"role": "marketeer", "created_at": {"$gte": start_date, "$lte": end_date}}
+    )
+    return {
+        "uploads": unit_uploads,
+        "downloads": unit_downloads,
+        "marketeers": new_marketeers,
+        "month_abbr": calendar.month_abbr[month],
+    }
+
+
+@router.post("/engagement", description="bulk ingest views, likes and platform links")
+def ingest_engagement(batch: EngagementBatch, admin: dict = Depends(oauth2.require_admin)):
+    records = [record.dict() for record in batch.records]
+    try:
+        result = engagement.apply(EngagementBatches, User, Video, Engagement, Meta, batch.batch_id, records)
+    except (engagement.BatchConflict, engagement.BatchInProgress) as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+    http_cache.touch("users", "videos")
+    return {"status": "success", **result}
+
+
+@router.get("/engagement/history", description="views and likes over time, bucketed for charts")
+def get_engagement_history(
+    creator: str | None = None,
+    video: str | None = None,
+    platform: str | None = None,
+    granularity: str | None = Query(None, regex="^(hour|day)$"),
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    user_id: str = Depends(oauth2.require_user),
+):
     user = User.find_one({"_id": ObjectId(user_id)})
+    # "...Z" or "+02:00" parse as aware; everything stored is naive UTC
+    start, end = (value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value for value in (start, end))
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be before to.")
+    # hourly buckets only while they fit a chart and are still retained
+    granularity = granularity or ("hour" if end - start <= timedelta(days=14) else "day")
+
+    match = {}
+    try:
+        if creator:
+            match["creator"] = ObjectId(creator)
+        if video:
+            match["video"] = ObjectId(video)
+    except InvalidId:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid id.")
     if user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You have no permission to get dashboard data!",
-        )
+        # everyone else only sees their own numbers
+        match["creator"] = user["_id"]
+    if platform:
+        match["platform"] = platform
+
+    series = engagement.history(
+        AnalyticsEngagement,
+        {"hour": AnalyticsEngagementHourly, "day": AnalyticsEngagementDaily},
+        AnalyticsMeta,
+        match,
+        granularity,
+        start,
+        end,
+    )
+    return {"status": "success", "granularity": granularity, "series": series}
+
+
+def load_dashboard_info():
     info = {"revenue": 12000000, "brands": 1000, "this_month_revenue": 2000000}
-    info["creators"] = User.count_documents({"role": "creator"})
-    info["marketeers"] = User.count_documents({"role": "marketeer"})
-    info["videos"] = Video.count_documents({})
 
     pipeline = [
         {
@@ -215,100 +302,91 @@ async def get_dashboard_info(user_id: str = Depends(oauth2.require_user)):
         },
     ]
 
-    result = list(User.aggregate(pipeline))
-    info["likes"] = result[0]["total_likes"]
-    info["views"] = result[0]["total_views"]
-    info["channels"] = result[0]["channels"]
-
     start_date = datetime.utcnow().replace(
         day=1, hour=0, minute=0, second=0, microsecond=0
     )
     end_date = datetime.utcnow()
-    info["this_month_uploads"] = Video.count_documents(
-        {"created_at": {"$gte": start_date, "$lte": end_date}}
-    )
-    info["this_month_downloads"] = Video.count_documents(
-        {
-            "created_at": {"$gte": start_date, "$lte": end_date},
-            "marketeer": {"$ne": None},
-        }
-    )
-
-    performance = []
 
+    # the last twelve months, oldest first
+    months = []
     for i in range(datetime.utcnow().month, 13):
-        start_date = datetime.utcnow().replace(
-            year=datetime.utcnow().year - 1,
-            month=i,
-            day=1,
-            hour=0,
-            minute=0,
-            second=0,
-            microsecond=0,
-        )
-        end_date = datetime.utcnow().replace(
-            year=datetime.utcnow().year - 1,
-            month=i,
-            day=calendar.monthrange(start_date.year, start_date.month)[1],
-            hour=23,
-            minute=59,
-            second=59,
-            microsecond=99,
-        )
-        unit_uploads = Video.count_documents(
-            {"created_at": {"$gte": start_date, "$lte": end_date}}
-        )
-        unit_downloads = Video.count_documents(
-            {
-                "created_at": {"$gte": start_date, "$lte": end_date},
-                "marketeer": {"$ne": None},
-            }
-        )
-        new_marketeers = User.count_documents(
-            {"role": "marketeer", "created_at": {"$gte": start_date, "$lte": end_date}}
-        )
-        performance.append(
-            {
-                "uploads": unit_uploads,
-                "downloads": unit_downloads,
-                "marketeers": new_marketeers,
-                "month_abbr": calendar.month_abbr[1:][i - 1]
-            }
-        )
-
+        months.append((datetime.utcnow().year - 1, i))
     for i in range(1, datetime.utcnow().month):
-        start_date = datetime.utcnow().replace(
-            month=i, day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        end_date = datetime.utcnow().replace(
-            month=i,
-            day=calendar.monthrange(start_date.year, start_date.month)[1],
-            hour=23,
-            minute=59,
-            second=59,
-            microsecond=99,
-        )
-        unit_uploads = Video.count_documents(
+        months.append((datetime.utcnow().year, i))
+
+    # every count is independent, so run them all at once
+    (
+        info["creators"],
+        info["marketeers"],
+        info["videos"],
+        totals,
+        info["this_month_uploads"],
+        info["this_month_downloads"],
+        *performance,
+    ) = database.concurrently(
+        lambda: AnalyticsUser.count_documents({"role": "creator"}),
+        lambda: AnalyticsUser.count_documents({"role": "marketeer"}),
+        lambda: AnalyticsVideo.count_documents({}),
+        lambda: list(AnalyticsUser.aggregate(pipeline)),
+        lambda: AnalyticsVideo.count_documents(
             {"created_at": {"$gte": start_date, "$lte": end_date}}
-        )
-        unit_downloads = Video.count_documents(
+        ),
+        lambda: AnalyticsVideo.count_documents(
             {
                 "created_at": {"$gte": start_date, "$lte": end_date},
                 "marketeer": {"$ne": None},
             }
-        )
-        new_marketeers = User.count_documents(
-            {"role": "marketeer", "created_at": {"$gte": start_date, "$lte": end_date}}
-        )
-        performance.append(
-            {
-                "uploads": unit_uploads,
-                "downloads": unit_downloads,
-                "marketeers": new_marketeers,
-                "month_abbr": calendar.month_abbr[1:][i - 1]
-            }
-        )
+        ),
+        *(lambda year=year, month=month: month_performance(year, month) for year, month in months),
+    )
+    info["likes"] = totals[0]["total_likes"]
+    info["views"] = totals[0]["total_views"]
+    info["channels"] = totals[0]["channels"]
 
     info["performance"] = performance
+    return info
+
 
-    return {"status": "success", "info": info}
+@router.get("/admin", description="gets dashboard info")
+def get_dashboard_info(request: Request, admin: dict = Depends(oauth2.require_admin)):
+    return http_cache.cached_response(
+        request, "stats:admin", ("users", "videos"), settings.STATS_CACHE_SECONDS,
+        lambda: {
+            "status": "success",
+            "info": shared_cache.cached("stats:admin", settings.STATS_CACHE_SECONDS, load_dashboard_info),
+        },
+    )
+
+
+@router.get("/admission", description="concurrency limits and shedding per route class")
+async def get_admission(admin: dict = Depends(oauth2.require_admin)):
+    return {"status": "success", "classes": admission.metrics()}
+
+
+@router.get("/profiles", description="recent request profiles with their CPU and wall time, see profiling.py")
+def get_profiles(
+    path: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin: dict = Depends(oauth2.require_admin),
+):
+    query = {"path": path} if path else {}
+    profiles = []
+    for row in Profiles.find(query, {"collapsed": 0}).sort("_id", -1).limit(limit):
+        row["id"] = str(row.pop("_id"))
+        row["user_id"] = str(row["user_id"]) if row.get("user_id") else None
+        profiles.append(row)
+    return {"status": "success", "profiles": profiles}
+
+
+@router.get("/profiles/{profile_id}", description="downloads a profile as folded stacks for flamegraph.pl or speedscope")
+def download_profile(profile_id: str, admin: dict = Depends(oauth2.require_admin)):
+    try:
+        profile = Profiles.find_one({"_id": ObjectId(profile_id)}, {"collapsed": 1})
+    except InvalidId:
+        profile = None
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+    return PlainTextResponse(
+        profile["collapsed"],
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
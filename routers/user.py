@@ -1,20 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from serializers.userSerializers import userResponseEntity, userEntity
 from datetime import datetime, timedelta
-from random import randbytes
-import hashlib
 from pydantic import EmailStr
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from config import settings
 
-from database import User, Video
+from engagement import PLATFORMS
+from database import User, Video, Jobs, AnalyticsUser, VerificationTokens, allocate_creator_hashtags
 from schemas import userSchemas, usualSchemas
 import oauth2
+import http_cache
+import tokens
 import utils
+import user_import
+import user_search
+import aiofiles
+import os
+import tempfile
 from emails.verifyEmail import VerifyEmail
 from emails.contactEmail import ContactEmail
 
 router = APIRouter()
+# what PATCH / may change; role, views, hashtag and the like are not the user's to set
+PROFILE_FIELDS = ("name", "email", "mobile", "password")
 
 
 @router.get(
@@ -28,13 +40,14 @@ def get_me(user_id: str = Depends(oauth2.require_user)):
 
 
 @router.get("/", description="gets users list")
-def get_users(user_id: str = Depends(oauth2.require_user)):
-    user = User.find_one({"_id": ObjectId(user_id)})
-    if user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You have no permission to get users list.",
-        )
+def get_users(request: Request, admin: dict = Depends(oauth2.require_admin)):
+    return http_cache.cached_response(
+        request, "users:list", ("users", "videos"), settings.STATS_CACHE_SECONDS,
+        lambda: {"status": "success", "users": load_users()},
+    )
+
+
+def load_users():
     # Set the date range (first 40 days)
     start_date = datetime.now() - timedelta(days=40)
 
@@ -86,68 +99,60 @@ def get_users(user_id: str = Depends(oauth2.require_user)):
             }
         },
     ]
-    users = User.aggregate(pipeline)
+    users = AnalyticsUser.aggregate(pipeline)
     users_list = []
     for user in users:
         user.pop("_id")
         users_list.append(user)
-    return {"status": "success", "users": users_list}
+    return users_list
 
 
-@router.post("/", description="create new user")
-async def create_user(
-    payload: userSchemas.CreateUserSchema, user_id: str = Depends(oauth2.require_user)
+@router.get("/search", description="prefix or fuzzy search over users")
+def search_users(
+    q: str | None = None,
+    role: str | None = None,
+    fuzzy: bool = False,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin: dict = Depends(oauth2.require_admin),
 ):
-    user = User.find_one({"_id": ObjectId(user_id)})
-    if user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You have no permission to create new user!",
-        )
-
-    # Check if user already exist
-    user = User.find_one({"email": payload.email.lower()})
+    try:
+        users, next_cursor = user_search.search(User, q, role, fuzzy, cursor, limit)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    return {"status": "success", "users": users, "next_cursor": next_cursor}
 
-    if user:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT, detail="Account already exist"
-        )
 
+@router.post("/", description="create new user")
+async def create_user(
+    payload: userSchemas.CreateUserSchema, admin: dict = Depends(oauth2.require_admin)
+):
     #  Hash the password
     payload.password = utils.hash_password(payload.password)
     del payload.passwordConfirm
     if payload.role == "creator":
-        count = User.count_documents({"role": "creator"})
-        payload.hashtag = f"#eurasia{str(count).zfill(10)}"
+        payload.hashtag = allocate_creator_hashtags(1)[0]
     payload.email = payload.email.lower()
     payload.created_at = datetime.utcnow()
     payload.updated_at = payload.created_at
 
-    result = User.insert_one(payload.dict())
-    new_user = User.find_one({"_id": result.inserted_id})
-
+    new_user = payload.dict()
+    new_user.update(user_search.search_fields(new_user))
     try:
-        token = randbytes(10)
-        hashedCode = hashlib.sha256()
-        hashedCode.update(token)
-        verification_code = hashedCode.hexdigest()
-        User.find_one_and_update(
-            {"_id": result.inserted_id},
-            {
-                "$set": {
-                    "verification_code": verification_code,
-                    "updated_at": datetime.utcnow(),
-                }
-            },
+        User.insert_one(new_user)
+    except DuplicateKeyError:
+        # the creator number allocated above is skipped, as in bulk imports
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Account already exist"
         )
-        # print(token.hex())
-        await VerifyEmail(userEntity(new_user), token.hex(), [EmailStr(payload.email)]).sendVerificationCode()
+    http_cache.touch("users")
+
+    try:
+        token = tokens.issue(VerificationTokens, new_user["_id"], tokens.VERIFY)
+        await VerifyEmail(userEntity(new_user), token, [EmailStr(payload.email)]).sendVerificationCode()
     except Exception as error:
         print(error)
-        User.find_one_and_update(
-            {"_id": result.inserted_id},
-            {"$set": {"verification_code": None, "updated_at": datetime.utcnow()}},
-        )
+        tokens.revoke(VerificationTokens, new_user["_id"], tokens.VERIFY)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error sending email",
@@ -158,23 +163,78 @@ async def create_user(
     }
 
 
+IMPORT_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+IMPORT_CHUNK_SIZE = 1024 * 1024
+
+
+@router.post("/import", status_code=status.HTTP_202_ACCEPTED, description="bulk import users from CSV or NDJSON")
+async def import_users(file: UploadFile = File(...), admin: dict = Depends(oauth2.require_admin)):
+    fmt = IMPORT_FORMATS.get(os.path.splitext(file.filename or "")[1].lower())
+    if not fmt:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Upload a .csv, .ndjson or .jsonl file.",
+        )
+
+    # Spool to our own file: the upload is closed once this request returns
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    async with aiofiles.open(path, "wb") as out_file:
+        while content := await file.read(IMPORT_CHUNK_SIZE):
+            await out_file.write(content)
+
+    job_id = user_import.create_job(ObjectId(admin["id"]), file.filename, fmt)
+    user_import.start(job_id, path, fmt)
+    return {"status": "success", "job_id": str(job_id)}
+
+
+@router.get("/import/{job_id}", description="progress of a bulk user import")
+def get_import(job_id: str, user_id: str = Depends(oauth2.require_user)):
+    try:
+        job = Jobs.find_one({"_id": ObjectId(job_id), "created_by": ObjectId(user_id)})
+    except InvalidId:
+        job = None
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No import with this id.")
+    job["_id"] = str(job["_id"])
+    job["created_by"] = str(job["created_by"])
+    return {"status": "success", "job": job}
+
+
 @router.put("/channel", description="add new channels")
 async def add_channel(
     payload: usualSchemas.AddChannelRequestSchema,
     user_id: str = Depends(oauth2.require_user),
 ):
+    if payload.channel_type.lower() not in PLATFORMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Channel type must be one of {', '.join(PLATFORMS)}",
+        )
     User.update_one(
         {"_id": ObjectId(user_id)},
         {"$set": {payload.channel_type.lower(): payload.channel_list}},
     )
+    http_cache.touch("users")
     return {"status": "success"}
 
 
+def searchable_update(user_id: str, fields: dict) -> dict:
+    # search fields are derived from several profile fields, so merge the change into the stored ones
+    current = User.find_one({"_id": ObjectId(user_id)}, {field: 1 for field in user_search.SEARCHED_FIELDS})
+    return user_search.search_fields({**current, **fields})
+
+
 @router.patch("/", description="updates user profile")
 async def update_profile(
     payload: usualSchemas.UpdateProfileRequestSchema,
     user_id: str = Depends(oauth2.require_user),
 ):
+    if payload.field_name not in PROFILE_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Field must be one of {', '.join(PROFILE_FIELDS)}",
+        )
     if payload.field_name == "email":
         exsiting = User.find_one({"email": payload.field_data})
         if exsiting:
@@ -188,12 +248,40 @@ async def update_profile(
                 detail="Password must be longer than 8 letters.",
             )
         payload.field_data = utils.hash_password(payload.field_data)
-    User.update_one(
-        {"_id": ObjectId(user_id)}, {"$set": {payload.field_name: payload.field_data}}
-    )
+    fields = {payload.field_name: payload.field_data}
+    if payload.field_name in user_search.SEARCHED_FIELDS:
+        fields.update(searchable_update(user_id, fields))
+    User.update_one({"_id": ObjectId(user_id)}, {"$set": fields})
+    http_cache.touch("users")
     return {"status": "success"}
 
 
+@router.patch("/profile", response_model=userSchemas.UserResponse, description="updates several profile fields at once")
+async def update_profile_fields(
+    payload: userSchemas.UpdateProfileSchema,
+    user_id: str = Depends(oauth2.require_user),
+):
+    fields = payload.dict(exclude_unset=True, exclude_none=True)
+    if not fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to update"
+        )
+    if "password" in fields:
+        # bcrypt takes a few hundred milliseconds; keep it off the event loop
+        fields["password"] = await asyncio.to_thread(utils.hash_password, fields["password"])
+    if any(field in user_search.SEARCHED_FIELDS for field in fields):
+        fields.update(searchable_update(user_id, fields))
+    fields["updated_at"] = datetime.utcnow()
+    user = User.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": fields},
+        projection={"password": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    http_cache.touch("users")
+    return {"status": "success", "user": userResponseEntity(user)}
+
+
 @router.post("/contact", description="Contact")
 async def contact(content: userSchemas.ContactSchema, user_id: str = Depends(oauth2.require_user)):
     user = User.find_one({"_id": ObjectId(user_id)})
@@ -1,43 +1,93 @@
-from fastapi import APIRouter, UploadFile, File, Depends, Body, HTTPException, status
+from fastapi import APIRouter, UploadFile, File, Depends, Body, HTTPException, Query, Request, WebSocket, status
+from fastapi.responses import StreamingResponse
 import oauth2
+from oauth2 import AuthJWT
+import events
+import http_cache
+import tracing
 import aiofiles
+import asyncio
+import hashlib
+import json
+import os
+import re
+import zlib
 from bson.objectid import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
 
-from database import User, Video
-from utils import generate_filename
+from database import User, Video, Events
+from bundle import ZipBundle, file_crc32, parse_range
+from media import Mp4Probe, InvalidMedia
+from utils import generate_filename, normalize_hashtag, normalize_hashtags, search_key
 from schemas.videoSchemas import VideoBaseSchema
+from trending import trending
+from config import settings
 
 router = APIRouter()
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 @router.post("/upload")
-async def upload_videos(files: list[UploadFile] = File(...), hashtags: str = Body(..., embed=True), user_id: str = Depends(oauth2.require_user)):
+async def upload_videos(files: list[UploadFile] = File(...), hashtags: str = Body(..., embed=True), brand: str | None = Body(None, embed=True), title: str | None = Body(None, embed=True), user_id: str = Depends(oauth2.require_user)):
     user = User.find_one({"_id": ObjectId(user_id)})
     if user["role"] != "creator":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You have no permission to upload videos.")
 
     current_time = datetime.utcnow()
-    hash_array = hashtags.split(",")
-    hash_array.append(user["hashtag"])
-
-    for file in files:
-        generated_name = generate_filename(file.filename)
-        video_doc = VideoBaseSchema(filename=generated_name, creator=ObjectId(user_id), hashtags=hash_array, uploaded_at=current_time, created_at=current_time, updated_at=current_time)
-        destination_file_path = f"./static/uploads/{generated_name}"
-        async with aiofiles.open(destination_file_path, 'wb') as out_file:
-            while content := await file.read(1024):
-                await out_file.write(content)
-        Video.insert_one(video_doc.dict())
-        
+    hash_array = normalize_hashtags(hashtags)
+    if user.get("hashtag") and normalize_hashtag(user["hashtag"]) not in hash_array:
+        hash_array.append(normalize_hashtag(user["hashtag"]))
+
+    # Every file is written and probed before any is recorded, so one bad
+    # file rejects the whole request instead of leaving the ones before it in.
+    written = []
+    uploads = []
+    try:
+        for file in files:
+            generated_name = generate_filename(file.filename)
+            destination_file_path = f"./static/uploads/{generated_name}"
+            written.append(destination_file_path)
+            # Parse container metadata from the same chunks we write, so a
+            # non-video payload is rejected before it lands in uploads.
+            probe = Mp4Probe()
+            crc = 0
+            try:
+                with tracing.span("upload.write", filename=generated_name) as span:
+                    size = 0
+                    async with aiofiles.open(destination_file_path, 'wb') as out_file:
+                        while content := await file.read(UPLOAD_CHUNK_SIZE):
+                            probe.feed(content)
+                            crc = zlib.crc32(content, crc)
+                            size += len(content)
+                            await out_file.write(content)
+                    if span:
+                        span.set(bytes=size)
+                media = probe.result()
+            except InvalidMedia as error:
+                raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"{file.filename}: {error}")
+            uploads.append((generated_name, media, crc))
+    except BaseException:
+        # a bad file, a disconnect or a full disk must not leave partial uploads behind
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    for generated_name, media, crc in uploads:
+        video_doc = VideoBaseSchema(brand=brand, title=title, brand_key=search_key(brand), title_key=search_key(title), filename=generated_name, creator=ObjectId(user_id), hashtags=hash_array, media=media, crc32=crc, uploaded_at=current_time, created_at=current_time, updated_at=current_time)
+        result = Video.insert_one(video_doc.dict())
+        trending.record("uploads", hash_array)
+        events.publish(Events, "video.added", {"_id": str(result.inserted_id), "src": generated_name, "hashtags": hash_array, "media": media})
+        http_cache.touch("videos")
+
     return {"status": "success"}
 
-@router.get("/downloadable")
-async def get_downloadable_videos(user_id: str = Depends(oauth2.require_user)):
+def downloadable_videos(user_id: str):
     availables = Video.find({"$or": [{"marketeer": {"$exists": False}}, {"marketeer": {"$eq": None}}]})
     videos = []
 
     for row in availables:
-        videos.append({"_id": str(row["_id"]), "src": row["filename"]})
+        videos.append({"_id": str(row["_id"]), "src": row["filename"], "media": row.get("media")})
 
     start_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     end_date = datetime.utcnow()
@@ -62,7 +112,86 @@ async def get_downloadable_videos(user_id: str = Depends(oauth2.require_user)):
     for row in downloaded_today:
         today_list.append({"_id": str(row["_id"]), "hashtags": row["hashtags"]})
 
-    return {"status": "success", "videos": videos, "day_download": day_download, "today_list": today_list}
+    return {"videos": videos, "day_download": day_download, "today_list": today_list}
+
+@router.get("/downloadable")
+def get_downloadable_videos(request: Request, user_id: str = Depends(oauth2.require_user)):
+    return http_cache.cached_response(
+        request, f"videos:downloadable:{user_id}", ("videos",), settings.STATS_CACHE_SECONDS,
+        lambda: {"status": "success", **downloadable_videos(user_id)},
+    )
+
+EPOCH = datetime(1970, 1, 1)
+
+def encode_cursor(row):
+    # "<uploaded_at in epoch ms>-<_id>" of the last row on the page
+    millis = (row["uploaded_at"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}-{row['_id']}"
+
+def decode_cursor(cursor: str):
+    try:
+        millis, video_id = cursor.split("-", 1)
+        return EPOCH + timedelta(milliseconds=int(millis)), ObjectId(video_id)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+@router.get("/search")
+async def search_videos(
+    hashtags: str | None = None,
+    brand: str | None = None,
+    title: str | None = None,
+    uploaded_from: datetime | None = None,
+    uploaded_to: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    user_id: str = Depends(oauth2.require_user),
+):
+    # Only unclaimed videos; "marketeer": None matches both null and missing
+    query = {"marketeer": None}
+    if hashtags:
+        hash_array = normalize_hashtags(hashtags)
+        if hash_array:
+            query["hashtags"] = {"$all": hash_array}
+    if brand:
+        query["brand_key"] = search_key(brand)
+    if title and search_key(title):
+        query["title_key"] = {"$regex": f"^{re.escape(search_key(title))}"}
+    if uploaded_from or uploaded_to:
+        query["uploaded_at"] = {}
+        if uploaded_from:
+            query["uploaded_at"]["$gte"] = uploaded_from
+        if uploaded_to:
+            query["uploaded_at"]["$lte"] = uploaded_to
+    if cursor:
+        uploaded_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"uploaded_at": {"$lt": uploaded_at}},
+            {"uploaded_at": uploaded_at, "_id": {"$lt": last_id}},
+        ]
+
+    rows = Video.find(
+        query,
+        {"filename": 1, "hashtags": 1, "brand": 1, "title": 1, "media": 1, "uploaded_at": 1},
+    ).sort([("uploaded_at", -1), ("_id", -1)]).limit(limit + 1)
+
+    videos = []
+    next_cursor = None
+    for row in rows:
+        if len(videos) == limit:
+            next_cursor = encode_cursor(last)
+            break
+        last = row
+        videos.append({
+            "_id": str(row["_id"]),
+            "src": row["filename"],
+            "hashtags": row["hashtags"],
+            "brand": row.get("brand"),
+            "title": row.get("title"),
+            "media": row.get("media"),
+            "uploaded_at": row["uploaded_at"],
+        })
+
+    return {"status": "success", "videos": videos, "next_cursor": next_cursor}
 
 @router.put("/download")
 async def download_videos(video_id: str = Body(..., embed=True), user_id: str = Depends(oauth2.require_user)):
@@ -89,5 +218,124 @@ async def download_videos(video_id: str = Body(..., embed=True), user_id: str =
 
     video = Video.find_one({"_id": ObjectId(video_id)})
     Video.update_one({"_id": ObjectId(video_id)}, {"$set": {"marketeer": ObjectId(user_id), "downloaded_at": datetime.utcnow()}})
+    trending.record("claims", video["hashtags"])
+    events.publish(Events, "video.claimed", {"_id": video_id})
+    http_cache.touch("videos")
 
     return {"status": "success", "src": video["filename"]}
+
+def build_bundle(videos):
+    # Sizes and CRCs must be known before the first byte goes out; videos
+    # uploaded before crc32 was recorded get it computed once and saved.
+    bundle = ZipBundle()
+    manifest = {"videos": [], "missing": []}
+    fingerprint = hashlib.sha1()
+    for row in videos:
+        path = f"./static/uploads/{row['filename']}"
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            manifest["missing"].append(str(row["_id"]))
+            continue
+        crc = row.get("crc32")
+        if crc is None:
+            crc = file_crc32(path)
+            Video.update_one({"_id": row["_id"]}, {"$set": {"crc32": crc}})
+        bundle.add(row["filename"], size, crc, row["uploaded_at"], path=path)
+        fingerprint.update(f"{row['filename']}:{size}:{crc};".encode())
+        manifest["videos"].append({
+            "_id": str(row["_id"]),
+            "file": row["filename"],
+            "hashtags": row["hashtags"],
+            "brand": row.get("brand"),
+            "title": row.get("title"),
+            "media": row.get("media"),
+            "downloaded_at": row.get("downloaded_at"),
+            "size": size,
+            "crc32": f"{crc:08x}",
+        })
+    latest = max(row.get("downloaded_at") or row["uploaded_at"] for row in videos)
+    manifest_bytes = json.dumps(manifest, default=str, indent=2, sort_keys=True).encode()
+    bundle.add_bytes("manifest.json", manifest_bytes, latest)
+    bundle.close()
+    # the manifest is streamed too (titles, hashtags and media can change), so
+    # an If-Range resume must not splice it from another version of the archive
+    fingerprint.update(f"{latest};".encode())
+    fingerprint.update(manifest_bytes)
+    return bundle, f'"{fingerprint.hexdigest()}"'
+
+@router.get("/bundle")
+async def download_bundle(request: Request, ids: str | None = None, user_id: str = Depends(oauth2.require_user)):
+    query = {"marketeer": ObjectId(user_id)}
+    if ids:
+        try:
+            query["_id"] = {"$in": [ObjectId(video_id.strip()) for video_id in ids.split(",") if video_id.strip()]}
+        except InvalidId:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid video id.")
+    videos = list(Video.find(query).sort([("downloaded_at", 1), ("_id", 1)]))
+    if not videos:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No claimed videos to bundle.")
+
+    bundle, etag = await asyncio.to_thread(build_bundle, videos)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": 'attachment; filename="eurasia-videos.zip"',
+    }
+
+    start, end = 0, bundle.size - 1
+    status_code = status.HTTP_200_OK
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            requested = parse_range(range_header, bundle.size)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, detail="Range not satisfiable.", headers={"Content-Range": f"bytes */{bundle.size}"})
+        if requested:
+            start, end = requested
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{bundle.size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(bundle.stream(start, end), status_code=status_code, media_type="application/zip", headers=headers)
+
+@router.get("/events")
+async def video_events(request: Request, last_event_id: str | None = None, user_id: str = Depends(oauth2.require_user)):
+    # EventSource sends Last-Event-ID on reconnect; the query parameter covers other clients
+    last_id = request.headers.get("last-event-id") or last_event_id
+
+    async def body():
+        async for event in events.stream(Events, last_id):
+            yield events.sse(event)
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket("/ws")
+async def video_events_ws(websocket: WebSocket, token: str | None = None, last_event_id: str | None = None, Authorize: AuthJWT = Depends()):
+    # Browsers can't set headers on websockets: the access token comes from ?token= or the cookie
+    await websocket.accept()
+    try:
+        if token:
+            Authorize.jwt_required("websocket", token=token)
+        else:
+            Authorize.jwt_required("websocket", websocket=websocket)
+        user = User.find_one({"_id": ObjectId(str(Authorize.get_raw_jwt(token)["sub"]))})
+    except Exception:
+        user = None
+    if not user or not user["verified"]:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    async def forward():
+        async for event in events.stream(Events, last_event_id):
+            await websocket.send_text(json.dumps(event or {"id": None, "kind": "keepalive", "data": {}}, default=str))
+        await websocket.close()
+
+    # Incoming messages are ignored; reading them is how a disconnect is noticed
+    forwarder = asyncio.create_task(forward())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        forwarder.cancel()
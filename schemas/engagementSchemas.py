@@ -0,0 +1,21 @@
+from pydantic import BaseModel, conlist, constr
+
+from config import settings
+
+
+class EngagementRecord(BaseModel):
+    user_id: str | None = None
+    video_id: str | None = None
+    views: int = 0
+    likes: int = 0
+    platform: str | None = None
+    tiktok: str | None = None
+    youtube: str | None = None
+    twitter: str | None = None
+    facebook: str | None = None
+    instagram: str | None = None
+
+
+class EngagementBatch(BaseModel):
+    batch_id: constr(min_length=1, max_length=128)
+    records: conlist(EngagementRecord, min_items=1, max_items=settings.ENGAGEMENT_MAX_RECORDS)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel, EmailStr, constr
+from pydantic import BaseModel, EmailStr, Extra, constr
 
 
 class UserBaseSchema(BaseModel):
@@ -34,6 +34,22 @@ class LoginUserSchema(BaseModel):
     password: constr(min_length=8)
 
 
+class UpdateProfileSchema(BaseModel):
+    # Everything a user may change about themselves in one request; any
+    # other field (role, views, verified...) is rejected
+    name: constr(strip_whitespace=True, min_length=1) | None = None
+    mobile: constr(strip_whitespace=True, min_length=1) | None = None
+    password: constr(min_length=8) | None = None
+    tiktok: list[str] | None = None
+    youtube: list[str] | None = None
+    twitter: list[str] | None = None
+    facebook: list[str] | None = None
+    instagram: list[str] | None = None
+
+    class Config:
+        extra = Extra.forbid
+
+
 class UserResponseSchema(UserBaseSchema):
     id: str
     pass
@@ -6,10 +6,14 @@ from bson.objectid import ObjectId
 class VideoBaseSchema(BaseModel):
     brand: str | None
     title: str | None
+    brand_key: str | None = None
+    title_key: str | None = None
     filename: str
     creator: ObjectId
     marketeer: ObjectId | None = None
     hashtags: list
+    media: dict | None = None
+    crc32: int | None = None
     uploaded_at: datetime
     downloaded_at: datetime | None = None
     tiktok: str | None = None
@@ -0,0 +1,31 @@
+"""Fill the admin search fields (search_terms, search_prefixes, search_trigrams) on existing users.
+
+    python -m scripts.backfill_user_search
+
+Users created before search existed have none.  Safe to run more than once.
+"""
+from pymongo import UpdateOne
+
+import database
+from database import User
+from user_search import SEARCHED_FIELDS, search_fields
+
+BATCH_SIZE = 1000
+
+
+def backfill():
+    database.ensure_indexes()
+    updates = []
+    changed = 0
+    for row in User.find({}, {field: 1 for field in SEARCHED_FIELDS}):
+        updates.append(UpdateOne({"_id": row["_id"]}, {"$set": search_fields(row)}))
+        if len(updates) == BATCH_SIZE:
+            changed += User.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        changed += User.bulk_write(updates, ordered=False).modified_count
+    print(f"Updated {changed} users")
+
+
+if __name__ == "__main__":
+    backfill()
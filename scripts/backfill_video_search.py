@@ -0,0 +1,41 @@
+"""Normalize hashtags and fill brand_key/title_key on existing videos.
+
+    python -m scripts.backfill_video_search
+
+Videos uploaded before search existed kept raw, untrimmed hashtags and
+have no search keys.  Safe to run more than once.
+"""
+from pymongo import UpdateOne
+
+import database
+from database import Video
+from utils import normalize_hashtag, search_key
+
+BATCH_SIZE = 1000
+
+
+def backfill():
+    database.ensure_indexes()
+    updates = []
+    changed = 0
+    for row in Video.find({}, {"hashtags": 1, "brand": 1, "title": 1}):
+        hashtags = []
+        for hashtag in row.get("hashtags") or []:
+            hashtag = normalize_hashtag(hashtag or "")
+            if hashtag and hashtag not in hashtags:
+                hashtags.append(hashtag)
+        updates.append(UpdateOne({"_id": row["_id"]}, {"$set": {
+            "hashtags": hashtags,
+            "brand_key": search_key(row.get("brand")),
+            "title_key": search_key(row.get("title")),
+        }}))
+        if len(updates) == BATCH_SIZE:
+            changed += Video.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        changed += Video.bulk_write(updates, ordered=False).modified_count
+    print(f"Updated {changed} videos")
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,27 @@
+"""Reclaim upload files that no video references.
+
+    python -m scripts.collect_orphan_uploads --dry-run
+    python -m scripts.collect_orphan_uploads --quarantine /var/tmp/orphans
+
+Runs one pass of the same collector the API runs every
+UPLOAD_GC_INTERVAL_MINUTES, honouring UPLOAD_GC_GRACE_MINUTES.
+"""
+import argparse
+import json
+
+from database import Video
+from upload_gc import UPLOADS_DIR, collect
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reclaim orphaned uploads")
+    parser.add_argument("--directory", default=UPLOADS_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be reclaimed")
+    parser.add_argument("--quarantine", default="", help="move orphans here instead of deleting them")
+    args = parser.parse_args()
+    report = collect(Video, args.directory, args.dry_run, args.quarantine)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Move pending verification codes off user documents into verification_tokens.
+
+    python -m scripts.migrate_verification_codes
+
+The stored code already is the sha256 of the emailed token, so it becomes the
+token's _id unchanged and links already sent keep working.  Each token gets
+a fresh VERIFICATION_TOKEN_HOURS lifetime.  Safe to re-run.
+"""
+from datetime import datetime
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import User, VerificationTokens, ensure_indexes
+import tokens
+
+BATCH_SIZE = 1000
+
+
+def flush(inserts: list, unsets: list):
+    # bulk_write refuses an empty list, and a batch of verified users has no codes to move
+    if inserts:
+        try:
+            VerificationTokens.bulk_write(inserts, ordered=False)
+        except BulkWriteError as error:
+            # tokens moved by an earlier, interrupted run
+            if any(write_error["code"] != 11000 for write_error in error.details["writeErrors"]):
+                raise
+    if unsets:
+        User.bulk_write(unsets, ordered=False)
+
+
+def main():
+    ensure_indexes()
+    now = datetime.utcnow()
+    moved = cleared = 0
+    inserts, unsets = [], []
+    for user in User.find({"verification_code": {"$exists": True}}, {"verification_code": 1}):
+        if user["verification_code"]:
+            inserts.append(InsertOne({
+                "_id": user["verification_code"],
+                "user_id": user["_id"],
+                "purpose": tokens.VERIFY,
+                "created_at": now,
+                "expires_at": now + tokens.LIFETIMES[tokens.VERIFY],
+            }))
+            moved += 1
+        else:
+            cleared += 1
+        unsets.append(UpdateOne({"_id": user["_id"]}, {"$unset": {"verification_code": ""}}))
+        if len(unsets) == BATCH_SIZE:
+            flush(inserts, unsets)
+            inserts, unsets = [], []
+    if unsets:
+        flush(inserts, unsets)
+    print(f"moved {moved} pending codes, cleared {cleared} empty ones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import bson
+
+from config import settings
+
+MAGIC = b"EVC1"
+# magic, slot count, slot size, generation
+HEADER = struct.Struct("<4sIIQ")
+GENERATION_OFFSET = HEADER.size - 8
+HEADER_SIZE = 64
+# seq, generation, key hash, expires at, key length, value length
+SLOT = struct.Struct("<QQQdII")
+MISSING = object()
+
+
+class SharedCache:
+    """Fixed-size cache in a memory-mapped file shared by every worker.
+
+    Each key hashes to one slot; a colliding key simply evicts it.  Readers
+    never lock: every slot carries a sequence number that writers make odd
+    while they write (a seqlock), so a reader retries instead of seeing a
+    torn entry.  Writers serialize on flock.  Entries remember the cache
+    generation they were written in, so bump() invalidates everything in
+    every worker at once.
+
+    The layout is part of the file name: a worker started with different
+    slot settings maps a file of its own, since resizing a file that other
+    workers have mapped kills them with SIGBUS.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int):
+        self.path = f"{path}-{MAGIC.decode().lower()}-{slots}x{slot_size}"
+        self.slots = slots
+        self.slot_size = slot_size
+        self.map = None
+        self.fd = None
+        self.thread_lock = threading.Lock()
+
+    def open(self):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # only a new file is sized; never shrink one that is mapped elsewhere
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            shared = mmap.mmap(fd, size)
+            magic, slots, slot_size, _ = HEADER.unpack_from(shared, 0)
+            if (magic, slots, slot_size) != (MAGIC, self.slots, self.slot_size):
+                shared[:size] = bytes(size)
+                HEADER.pack_into(shared, 0, MAGIC, self.slots, self.slot_size, 1)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.fd = fd
+        self.map = shared
+
+    def mapped(self) -> mmap.mmap:
+        if self.map is None:
+            with self.thread_lock:
+                if self.map is None:
+                    self.open()
+        return self.map
+
+    def locate(self, key: bytes):
+        digest = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+        return digest, HEADER_SIZE + (digest % self.slots) * self.slot_size
+
+    def generation(self) -> int:
+        return struct.unpack_from("<Q", self.mapped(), GENERATION_OFFSET)[0]
+
+    def get(self, key: str, default=MISSING):
+        shared = self.mapped()
+        encoded = key.encode()
+        digest, offset = self.locate(encoded)
+        for _ in range(16):
+            seq, generation, key_hash, expires_at, key_length, value_length = SLOT.unpack_from(shared, offset)
+            if seq & 1:
+                continue
+            if key_hash != digest or not key_length:
+                return default
+            start = offset + SLOT.size
+            data = shared[start:start + key_length + value_length]
+            if struct.unpack_from("<Q", shared, offset)[0] == seq:
+                break
+        else:
+            return default
+        if generation != self.generation() or expires_at < time.time() or data[:key_length] != encoded:
+            return default
+        return bson.decode(data[key_length:])["v"]
+
+    def write(self, key: bytes, generation: int, expires_at: float, value: bytes):
+        shared = self.mapped()
+        digest, offset = self.locate(key)
+        with self.thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                seq = struct.unpack_from("<Q", shared, offset)[0]
+                writing = seq | 1
+                struct.pack_into("<Q", shared, offset, writing)
+                SLOT.pack_into(shared, offset, writing, generation, digest, expires_at, len(key) if value else 0, len(value))
+                start = offset + SLOT.size
+                shared[start:start + len(key) + len(value)] = key + value
+                struct.pack_into("<Q", shared, offset, writing + 1)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def set(self, key: str, value, ttl: float, generation: int | None = None) -> bool:
+        # pass the generation read before computing value, so a bump() that
+        # happens meanwhile leaves the stale value unreadable
+        encoded = key.encode()
+        payload = bson.encode({"v": value})
+        if SLOT.size + len(encoded) + len(payload) > self.slot_size:
+            return False
+        if generation is None:
+            generation = self.generation()
+        self.write(encoded, generation, time.time() + ttl, payload)
+        return True
+
+    def delete(self, key: str):
+        self.write(key.encode(), 0, 0, b"")
+
+    def bump(self):
+        # invalidates every entry in every worker
+        shared = self.mapped()
+        with self.thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                struct.pack_into("<Q", shared, GENERATION_OFFSET, self.generation() + 1)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"{settings.MONGO_INITDB_DATABASE}-cache")
+
+
+cache = SharedCache(
+    settings.SHARED_CACHE_PATH or default_path(),
+    settings.SHARED_CACHE_SLOTS,
+    settings.SHARED_CACHE_SLOT_BYTES,
+)
+
+
+def cached(key: str, ttl: float, load):
+    value = cache.get(key)
+    if value is MISSING:
+        generation = cache.generation()
+        value = load()
+        cache.set(key, value, ttl, generation)
+    return value
@@ -0,0 +1,63 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+from config import settings
+
+VERIFY = "verify"
+# one entry per purpose; a token can only be consumed for the purpose it was issued for
+LIFETIMES = {
+    VERIFY: timedelta(hours=settings.VERIFICATION_TOKEN_HOURS),
+}
+
+
+def token_hash(token: str) -> str | None:
+    # None for anything that is not hex, so a garbled link is just "invalid"
+    try:
+        return hashlib.sha256(bytes.fromhex(token)).hexdigest()
+    except ValueError:
+        return None
+
+
+def token_doc(user_id, purpose: str, now: datetime):
+    token = secrets.token_bytes(16)
+    return token.hex(), {
+        # the hash is the _id, so lookups hit the unique _id index and the
+        # raw token is never stored
+        "_id": hashlib.sha256(token).hexdigest(),
+        "user_id": user_id,
+        "purpose": purpose,
+        "created_at": now,
+        "expires_at": now + LIFETIMES[purpose],
+    }
+
+
+def issue(collection, user_id, purpose: str) -> str:
+    token, doc = token_doc(user_id, purpose, datetime.utcnow())
+    collection.insert_one(doc)
+    return token
+
+
+def issue_many(collection, user_ids: list, purpose: str) -> list:
+    now = datetime.utcnow()
+    pairs = [token_doc(user_id, purpose, now) for user_id in user_ids]
+    if pairs:
+        collection.insert_many([doc for _, doc in pairs], ordered=False)
+    return [token for token, _ in pairs]
+
+
+def consume(collection, token: str, purpose: str):
+    """Deletes a live token in one atomic round trip and returns its user id, or None."""
+    hashed = token_hash(token)
+    if hashed is None:
+        return None
+    # the TTL monitor only runs once a minute, so expiry is checked here too
+    doc = collection.find_one_and_delete(
+        {"_id": hashed, "purpose": purpose, "expires_at": {"$gt": datetime.utcnow()}},
+        projection={"user_id": 1},
+    )
+    return doc["user_id"] if doc else None
+
+
+def revoke(collection, user_id, purpose: str):
+    collection.delete_many({"user_id": user_id, "purpose": purpose})
@@ -0,0 +1,326 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+
+from pymongo import monitoring
+
+from config import settings
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+# spans kept per trace; a runaway loop must not hold a request's worth of memory forever
+MAX_SPANS = 1000
+EXPORT_BATCH = 512
+
+current = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    # The spans of one request, kept until the root ends so slow requests can
+    # still be exported when head sampling passed them over.
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent_id: str | None, kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException | str):
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def finish(self, end: int | None = None):
+        self.end = end or time.time_ns()
+        if len(self.trace.spans) < MAX_SPANS:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped += 1
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def record(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def enabled() -> bool:
+    return bool(settings.TRACING_EXPORTER)
+
+
+def start_trace(name: str, traceparent: str | None = None, **attributes) -> Span | None:
+    """The root span of a request, continuing the caller's trace when traceparent is valid."""
+    if not enabled():
+        return None
+    match = TRACEPARENT.fullmatch((traceparent or "").strip().lower())
+    if match and match.group(1) != "0" * 32:
+        trace_id, parent_id, flags = match.groups()
+        # the caller's decision wins, so a trace is either whole or missing
+        sampled = bool(int(flags, 16) & 1)
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    return Span(Trace(trace_id, sampled), name, parent_id, SERVER, attributes)
+
+
+def end_trace(root: Span):
+    root.finish()
+    trace = root.trace
+    # tail rule: a request slower than TRACING_SLOW_MS is kept whatever the dice said
+    if trace.sampled or (settings.TRACING_SLOW_MS and root.end - root.start >= settings.TRACING_SLOW_MS * 1e6):
+        if trace.dropped:
+            root.set(**{"trace.dropped_spans": trace.dropped})
+        exporter.submit(trace.spans)
+
+
+@contextlib.contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """A child of the current span; does nothing outside a traced request."""
+    parent = current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = current.set(child)
+    try:
+        yield child
+    except BaseException as error:
+        child.fail(error)
+        raise
+    finally:
+        current.reset(token)
+        child.finish()
+
+
+def traced(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class CommandTracer(monitoring.CommandListener):
+    """A client span per pymongo command issued inside a traced request.
+
+    pymongo calls the listener on the thread running the command, so the
+    current span is the caller's.  Only the command name and collection are
+    recorded, never filters or documents.
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        parent = current.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name}
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        child = Span(parent.trace, f"mongo.{event.command_name}", parent.span_id, CLIENT, attributes)
+        self.pending[(event.connection_id, event.request_id)] = child
+
+    def succeeded(self, event):
+        child = self.pending.pop((event.connection_id, event.request_id), None)
+        if child is not None:
+            child.finish(child.start + event.duration_micros * 1000)
+
+    def failed(self, event):
+        child = self.pending.pop((event.connection_id, event.request_id), None)
+        if child is not None:
+            child.fail(f"{event.failure.get('codeName', 'Error')}: {event.failure.get('errmsg', '')}")
+            child.finish(child.start + event.duration_micros * 1000)
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_body(records: list) -> bytes:
+    # OTLP/HTTP JSON; ids stay hex, as the JSON mapping requires
+    spans = [{
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        **({"parentSpanId": record["parent_id"]} if record["parent_id"] else {}),
+        "name": record["name"],
+        "kind": record["kind"],
+        "startTimeUnixNano": str(record["start"]),
+        "endTimeUnixNano": str(record["end"]),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in record["attributes"].items()],
+        **({"status": {"code": STATUS_ERROR, "message": record["error"]}} if record["error"] else {}),
+    } for record in records]
+    return json.dumps({"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.TRACING_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}).encode()
+
+
+class Exporter:
+    """Ships finished traces from a daemon thread, so requests never wait on the collector or the disk.
+
+    The queue is bounded; when the sink falls behind, traces are dropped
+    and counted rather than buffered without limit.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=10000)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, spans: list):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="trace-export", daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait([span.record() for span in spans])
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            records = self.queue.get()
+            if records is None:
+                return
+            deadline = time.monotonic() + settings.TRACING_FLUSH_SECONDS
+            stop = False
+            while len(records) < EXPORT_BATCH and not stop:
+                try:
+                    more = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                else:
+                    records += more
+            try:
+                self.write(records)
+            except Exception as error:
+                self.failures += 1
+                print(f"Trace export failed: {error}")
+            if stop:
+                return
+
+    def write(self, records: list):
+        if settings.TRACING_EXPORTER == "otlp":
+            request = urllib.request.Request(
+                settings.TRACING_OTLP_ENDPOINT, data=otlp_body(records),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        else:
+            with open(settings.TRACING_JSONL_PATH, "a", encoding="utf-8") as out:
+                out.writelines(json.dumps(record, default=str) + "\n" for record in records)
+
+    def shutdown(self, timeout: float = 5):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+
+exporter = Exporter()
+
+
+class TracingMiddleware:
+    """Opens a server span per HTTP request and makes it current for the handler.
+
+    Plain ASGI so the span covers streamed bodies too.  The response
+    carries a traceparent header, so a slow request reported by a client
+    can be found in the collector.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        root = start_trace(
+            f"{scope['method']} {scope['path']}",
+            (headers.get(b"traceparent") or b"").decode("latin-1"),
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        token = current.set(root)
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                root.set(**{"http.status_code": message["status"]})
+                message["headers"] = [*message.get("headers", []), (b"traceparent", root.traceparent().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as error:
+            root.fail(error)
+            raise
+        finally:
+            current.reset(token)
+            # the router sets endpoint on the scope it was given
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                root.set(**{"code.function": endpoint.__name__})
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    root.name = f"{scope['method']} {route.path}"
+            if root.attributes.get("http.status_code", 200) >= 500 and root.error is None:
+                root.fail("server error")
+            end_trace(root)
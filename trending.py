@@ -0,0 +1,179 @@
+import array
+import asyncio
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from bson.binary import Binary
+
+from config import settings
+from utils import WORKER_ID
+
+KINDS = ("uploads", "claims")
+
+
+class DecayedSketch:
+    """Count-Min Sketch whose counts halve every `half_life` seconds.
+
+    Uses forward decay: an event at time t adds 2 ** ((t - landmark) / half_life),
+    so nothing has to be touched as time passes.  Landmarks sit on a fixed grid
+    shared by every worker, which keeps sketches from different processes
+    mergeable by plain addition.
+    """
+
+    def __init__(self, width: int, depth: int, half_life: float, landmark: float | None = None):
+        self.width = width
+        self.depth = depth
+        self.half_life = half_life
+        self.table = array.array("d", bytes(8 * width * depth))
+        self.landmark = self.align(time.time()) if landmark is None else landmark
+
+    def align(self, now: float) -> float:
+        # rescale every 32 half-lives, long before weights get anywhere near overflow
+        period = self.half_life * 32
+        return now - now % period
+
+    def cells(self, key: str) -> list:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [
+            row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def rescale(self, landmark: float):
+        factor = 2 ** ((self.landmark - landmark) / self.half_life)
+        for i in range(len(self.table)):
+            self.table[i] *= factor
+        self.landmark = landmark
+
+    def add(self, key: str, now: float, count: float = 1) -> float:
+        if now - self.landmark >= self.half_life * 32:
+            self.rescale(self.align(now))
+        weight = count * 2 ** ((now - self.landmark) / self.half_life)
+        cells = self.cells(key)
+        for cell in cells:
+            self.table[cell] += weight
+        return min(self.table[cell] for cell in cells)
+
+    def estimate(self, key: str) -> float:
+        return min(self.table[cell] for cell in self.cells(key))
+
+    def decayed(self, value: float, now: float) -> float:
+        # landmark-relative count -> count as of `now`
+        return value * 2 ** ((self.landmark - now) / self.half_life)
+
+    def merge(self, other: "DecayedSketch"):
+        if other.landmark > self.landmark:
+            self.rescale(other.landmark)
+        factor = 2 ** ((other.landmark - self.landmark) / self.half_life)
+        for i, value in enumerate(other.table):
+            self.table[i] += value * factor
+
+
+class TopHashtags:
+    """Decayed sketch plus a bounded set of the heaviest hashtags seen."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.sketch = new_sketch()
+        self.candidates = {}
+        self.lock = threading.Lock()
+
+    def add(self, hashtag: str, now: float):
+        with self.lock:
+            landmark = self.sketch.landmark
+            estimate = self.sketch.add(hashtag, now)
+            if self.sketch.landmark != landmark:
+                self.candidates = {key: self.sketch.estimate(key) for key in self.candidates}
+            if hashtag in self.candidates or len(self.candidates) < self.capacity:
+                self.candidates[hashtag] = estimate
+                return
+            lightest = min(self.candidates, key=self.candidates.get)
+            if estimate > self.candidates[lightest]:
+                del self.candidates[lightest]
+                self.candidates[hashtag] = estimate
+
+    def export(self) -> dict:
+        with self.lock:
+            return {
+                "landmark": self.sketch.landmark,
+                "width": self.sketch.width,
+                "depth": self.sketch.depth,
+                "table": Binary(self.sketch.table.tobytes()),
+                "candidates": list(self.candidates),
+            }
+
+
+def new_sketch(landmark: float | None = None) -> DecayedSketch:
+    return DecayedSketch(
+        settings.TRENDING_SKETCH_WIDTH,
+        settings.TRENDING_SKETCH_DEPTH,
+        settings.TRENDING_HALF_LIFE_MINUTES * 60,
+        landmark,
+    )
+
+
+class Trending:
+    """Per-worker counters for every event kind plus the last merged snapshot.
+
+    Handlers call record(); sync() persists this worker's sketches to Mongo
+    and rebuilds the snapshot from all workers, which top() serves from memory.
+    """
+
+    def __init__(self):
+        self.local = {kind: TopHashtags(settings.TRENDING_TOP_K) for kind in KINDS}
+        self.snapshot = {kind: [] for kind in KINDS}
+        self.snapshot_at = None
+
+    def record(self, kind: str, hashtags: list):
+        now = time.time()
+        for hashtag in hashtags:
+            if hashtag:
+                self.local[kind].add(hashtag, now)
+
+    def top(self, kind: str, limit: int) -> list:
+        return self.snapshot[kind][:limit]
+
+    def sync(self, collection):
+        now = time.time()
+        for kind, counters in self.local.items():
+            collection.update_one(
+                {"worker": WORKER_ID, "kind": kind},
+                {"$set": {**counters.export(), "updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+
+        snapshot = {}
+        for kind in KINDS:
+            merged = new_sketch()
+            candidates = set()
+            for doc in collection.find({"kind": kind}):
+                if doc["width"] != merged.width or doc["depth"] != merged.depth:
+                    continue
+                other = new_sketch(doc["landmark"])
+                other.table = array.array("d", doc["table"])
+                merged.merge(other)
+                candidates.update(doc["candidates"])
+            scores = sorted(
+                ((merged.decayed(merged.estimate(key), now), key) for key in candidates),
+                reverse=True,
+            )
+            snapshot[kind] = [
+                {"hashtag": key, "score": round(score, 2)}
+                for score, key in scores[:settings.TRENDING_TOP_K]
+            ]
+        self.snapshot = snapshot
+        self.snapshot_at = datetime.utcnow()
+
+
+trending = Trending()
+
+
+async def sync_forever(collection):
+    while True:
+        try:
+            await asyncio.to_thread(trending.sync, collection)
+        except Exception as error:
+            print(f"Trending sync failed: {error}")
+        await asyncio.sleep(settings.TRENDING_SYNC_SECONDS)
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from config import settings
+
+UPLOADS_DIR = "./static/uploads"
+
+
+def scan(directory: str, batch_size: int):
+    # scandir reads the directory lazily, so memory stays flat however many files there are
+    batch = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            batch.append(entry)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def collect(videos, directory: str = UPLOADS_DIR, dry_run: bool = False, quarantine: str = "") -> dict:
+    """One pass over the uploads directory; returns what was (or would be) reclaimed.
+
+    A file is an orphan when no video references it and it has not been
+    touched for UPLOAD_GC_GRACE_MINUTES, which leaves uploads in flight alone.
+    Orphans are moved to `quarantine` when given, otherwise deleted.
+    """
+    cutoff = time.time() - settings.UPLOAD_GC_GRACE_MINUTES * 60
+    report = {"scanned": 0, "orphans": 0, "reclaimed_bytes": 0, "errors": 0, "dry_run": dry_run, "orphan_files": []}
+    if quarantine and not dry_run:
+        os.makedirs(quarantine, exist_ok=True)
+    for batch in scan(directory, settings.UPLOAD_GC_BATCH_SIZE):
+        report["scanned"] += len(batch)
+        candidates = {}
+        for entry in batch:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < cutoff:
+                candidates[entry.name] = (entry.path, stat.st_size)
+        if not candidates:
+            continue
+        referenced = {row["filename"] for row in videos.find({"filename": {"$in": list(candidates)}}, {"filename": 1})}
+        for name, (path, size) in candidates.items():
+            if name in referenced:
+                continue
+            try:
+                if not dry_run:
+                    if quarantine:
+                        shutil.move(path, os.path.join(quarantine, name))
+                    else:
+                        os.remove(path)
+            except FileNotFoundError:
+                # another worker got there first
+                continue
+            except OSError as error:
+                print(f"Could not reclaim {path}: {error}")
+                report["errors"] += 1
+                continue
+            report["orphans"] += 1
+            report["reclaimed_bytes"] += size
+            if len(report["orphan_files"]) < 100:
+                report["orphan_files"].append(name)
+        time.sleep(settings.UPLOAD_GC_BATCH_PAUSE)
+    return report
+
+
+def claim(meta, interval: float) -> bool:
+    # Only one worker per interval runs a pass
+    now = datetime.utcnow()
+    return meta.find_one_and_update(
+        {"upload_gc_until": {"$not": {"$gt": now}}},
+        {"$set": {"upload_gc_until": now + timedelta(seconds=interval)}},
+    ) is not None
+
+
+async def collect_forever(videos, meta, jobs):
+    while True:
+        await asyncio.sleep(settings.UPLOAD_GC_INTERVAL_MINUTES * 60)
+        try:
+            if not await asyncio.to_thread(claim, meta, settings.UPLOAD_GC_INTERVAL_MINUTES * 60):
+                continue
+            started = datetime.utcnow()
+            report = await asyncio.to_thread(
+                collect, videos, UPLOADS_DIR, settings.UPLOAD_GC_DRY_RUN, settings.UPLOAD_GC_QUARANTINE
+            )
+            print(
+                f"Upload GC: {report['orphans']} orphans, {report['reclaimed_bytes']} bytes"
+                f"{' (dry run)' if report['dry_run'] else ''}"
+            )
+            jobs.insert_one({"kind": "upload_gc", "status": "done", **report, "created_at": started, "updated_at": datetime.utcnow()})
+        except Exception as error:
+            print(f"Upload GC failed: {error}")
@@ -0,0 +1,205 @@
+import asyncio
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pydantic import EmailStr, ValidationError
+from pymongo.errors import BulkWriteError
+
+from config import settings
+from database import Jobs, User, VerificationTokens, allocate_creator_hashtags
+from emails.verifyEmail import VerifyEmail
+from schemas import userSchemas
+import http_cache
+import tokens
+import user_search
+import utils
+
+ROLES = ("creator", "marketeer")
+DUPLICATE_KEY = 11000
+
+# bcrypt releases the GIL, so a few threads hash in parallel without
+# blocking the event loop.
+hash_pool = ThreadPoolExecutor(settings.IMPORT_HASH_THREADS, thread_name_prefix="import-hash")
+running = set()
+
+
+def read_rows(path: str, fmt: str):
+    # yields (row number, dict or error message), one line at a time
+    with open(path, newline="", encoding="utf-8-sig") as source:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(source), start=1):
+                yield number, {key.strip(): value.strip() for key, value in row.items() if key and value}
+            return
+        for number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, "Invalid JSON"
+                continue
+            yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def next_batch(rows, size: int) -> list:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            break
+    return batch
+
+
+def validate(row: dict) -> userSchemas.CreateUserSchema:
+    user = userSchemas.CreateUserSchema(**row)
+    if user.passwordConfirm is not None and user.passwordConfirm != user.password:
+        raise ValueError("Passwords do not match")
+    if user.role not in ROLES:
+        raise ValueError(f"Role must be one of {', '.join(ROLES)}")
+    return user
+
+
+class ImportJob:
+    def __init__(self, job_id, path: str, fmt: str):
+        self.job_id = job_id
+        self.path = path
+        self.fmt = fmt
+        self.seen = set()
+        # Bounded, so a slow mail server holds back reading the file rather
+        # than queueing a mail per row for the whole import
+        self.outbox = asyncio.Queue(maxsize=settings.IMPORT_BATCH_SIZE)
+        self.mail_results = {True: 0, False: 0}
+
+    def progress(self, errors: list, **counts):
+        update = {"$inc": counts, "$set": {"updated_at": datetime.utcnow()}}
+        if errors:
+            update["$push"] = {"errors": {"$each": errors, "$slice": settings.IMPORT_MAX_ERRORS}}
+        Jobs.update_one({"_id": self.job_id}, update)
+
+    async def run(self):
+        Jobs.update_one({"_id": self.job_id}, {"$set": {"status": "running", "updated_at": datetime.utcnow()}})
+        mailers = [asyncio.create_task(self.mailer()) for _ in range(settings.IMPORT_EMAIL_CONCURRENCY)]
+        try:
+            rows = read_rows(self.path, self.fmt)
+            while batch := await asyncio.to_thread(next_batch, rows, settings.IMPORT_BATCH_SIZE):
+                await self.import_batch(batch)
+            for _ in mailers:
+                await self.outbox.put(None)
+            await asyncio.gather(*mailers)
+            self.progress([], emails_sent=self.mail_results[True], emails_failed=self.mail_results[False])
+            Jobs.update_one({"_id": self.job_id}, {"$set": {"status": "done", "updated_at": datetime.utcnow()}})
+        except Exception as error:
+            print(f"User import {self.job_id} failed: {error}")
+            Jobs.update_one(
+                {"_id": self.job_id},
+                {"$set": {"status": "failed", "error": str(error), "updated_at": datetime.utcnow()}},
+            )
+        finally:
+            for mailer in mailers:
+                mailer.cancel()
+            os.remove(self.path)
+
+    async def import_batch(self, batch: list):
+        errors = []
+        users = []
+        for number, row in batch:
+            try:
+                if isinstance(row, str):
+                    raise ValueError(row)
+                user = validate(row)
+            except ValidationError as error:
+                field = error.errors()[0]
+                errors.append({"row": number, "error": f"{'.'.join(map(str, field['loc']))}: {field['msg']}"})
+                continue
+            except ValueError as error:
+                errors.append({"row": number, "error": str(error)})
+                continue
+            user.email = user.email.lower()
+            if user.email in self.seen:
+                errors.append({"row": number, "email": user.email, "error": "Duplicate email in file"})
+                continue
+            self.seen.add(user.email)
+            users.append((number, user))
+
+        loop = asyncio.get_running_loop()
+        hashes = await asyncio.gather(
+            *(loop.run_in_executor(hash_pool, utils.hash_password, user.password) for _, user in users)
+        )
+        # one round trip for the whole batch; rows lost to duplicates leave gaps
+        hashtags = iter(allocate_creator_hashtags(sum(user.role == "creator" for _, user in users)))
+
+        now = datetime.utcnow()
+        docs = []
+        for (number, user), hashed in zip(users, hashes):
+            user.password = hashed
+            del user.passwordConfirm
+            if user.role == "creator":
+                user.hashtag = next(hashtags)
+            user.created_at = now
+            user.updated_at = now
+            doc = user.dict()
+            doc.update(user_search.search_fields(doc))
+            docs.append(doc)
+
+        failed = set()
+        if docs:
+            try:
+                User.insert_many(docs, ordered=False)
+            except BulkWriteError as error:
+                for write_error in error.details["writeErrors"]:
+                    index = write_error["index"]
+                    failed.add(index)
+                    message = "Account already exist" if write_error["code"] == DUPLICATE_KEY else write_error["errmsg"]
+                    errors.append({"row": users[index][0], "email": docs[index]["email"], "error": message})
+
+        inserted = [doc for index, doc in enumerate(docs) if index not in failed]
+        if inserted:
+            http_cache.touch("users")
+        issued = tokens.issue_many(VerificationTokens, [doc["_id"] for doc in inserted], tokens.VERIFY)
+        self.progress(errors, processed=len(batch), inserted=len(docs) - len(failed), failed=len(errors))
+        for doc, token in zip(inserted, issued):
+            await self.outbox.put((doc["_id"], doc["name"], doc["email"], token))
+
+    async def mailer(self):
+        # one of IMPORT_EMAIL_CONCURRENCY workers draining the outbox until it gets None
+        while item := await self.outbox.get():
+            self.mail_results[await self.send_verification(*item)] += 1
+
+    async def send_verification(self, user_id, name: str, email: str, token: str) -> bool:
+        try:
+            await VerifyEmail({"name": name}, token, [EmailStr(email)]).sendVerificationCode()
+            return True
+        except Exception as error:
+            print(error)
+            tokens.revoke(VerificationTokens, user_id, tokens.VERIFY)
+            return False
+
+
+def create_job(created_by, filename: str, fmt: str):
+    now = datetime.utcnow()
+    return Jobs.insert_one({
+        "kind": "user_import",
+        "status": "queued",
+        "filename": filename,
+        "format": fmt,
+        "created_by": created_by,
+        "processed": 0,
+        "inserted": 0,
+        "failed": 0,
+        "emails_sent": 0,
+        "emails_failed": 0,
+        "errors": [],
+        "created_at": now,
+        "updated_at": now,
+    }).inserted_id
+
+
+def start(job_id, path: str, fmt: str):
+    # keep a reference so the task is not garbage collected mid-import
+    task = asyncio.create_task(ImportJob(job_id, path, fmt).run())
+    running.add(task)
+    task.add_done_callback(running.discard)
+    return task
@@ -0,0 +1,145 @@
+import re
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+from utils import search_key
+
+# Prefixes of every term up to PREFIX_MAX characters are stored, so a short
+# query is an equality match on a multikey index that also yields _id order.
+# Longer queries range-scan the full terms instead; they are selective.
+PREFIX_MIN = 2
+PREFIX_MAX = 10
+# fuzzy matching ranks at most this many users sharing a rare trigram with the query
+FUZZY_CANDIDATES = 5000
+# share of the query's trigrams a fuzzy match must contain
+FUZZY_MIN_SIMILARITY = 0.3
+SEARCHED_FIELDS = ("name", "email", "mobile", "hashtag")
+RESULT_FIELDS = {"name": 1, "email": 1, "mobile": 1, "role": 1, "hashtag": 1, "verified": 1, "created_at": 1}
+
+
+def digits(value: str) -> str:
+    return re.sub(r"\D", "", value)
+
+
+def terms(user: dict) -> list:
+    # "Jane Doe", jane@x.com, +1 555 0100, #eurasia01 -> jane doe, jane, doe, jane@x.com, 15550100, eurasia01
+    found = []
+    name = search_key(user.get("name")) or ""
+    if name:
+        found += [name] + name.split()
+    if user.get("email"):
+        found.append(user["email"].lower())
+    if user.get("mobile") and digits(user["mobile"]):
+        found.append(digits(user["mobile"]))
+    if user.get("hashtag"):
+        found.append(user["hashtag"].lower().lstrip("#"))
+    return list(dict.fromkeys(found))
+
+
+def trigrams(text: str) -> list:
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        grams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return list(dict.fromkeys(grams))
+
+
+def search_fields(user: dict) -> dict:
+    """The denormalized search fields for a user document; $set them on every write to name, email, mobile or hashtag."""
+    user_terms = terms(user)
+    prefixes = {term[:length] for term in user_terms for length in range(PREFIX_MIN, min(len(term), PREFIX_MAX) + 1)}
+    local_part = (user.get("email") or "").lower().split("@")[0]
+    return {
+        "search_terms": user_terms,
+        "search_prefixes": sorted(prefixes),
+        "search_trigrams": trigrams(f"{search_key(user.get('name')) or ''} {local_part}"),
+    }
+
+
+def normalize(query: str) -> str:
+    query = search_key(query) or ""
+    # phone numbers are stored as bare digits
+    if query and re.fullmatch(r"[\d\s+().-]+", query) and digits(query):
+        return digits(query)
+    return query.lstrip("#")
+
+
+def rare_trigrams(users, match: dict, grams: list, minimum: int) -> list:
+    """The query trigrams a fuzzy match must share at least one of, rarest first.
+
+    A user holding `minimum` of the query's n trigrams holds at least one of
+    any n - minimum + 1 of them, so candidates drawn from the rarest ones miss
+    no match.  Counts stop at FUZZY_CANDIDATES + 1: beyond that all that
+    matters is that the trigram is common.
+    """
+    counts = {
+        gram: users.count_documents({**match, "search_trigrams": gram}, limit=FUZZY_CANDIDATES + 1)
+        for gram in grams
+    }
+    return sorted(grams, key=lambda gram: (counts[gram], gram))[:len(grams) - minimum + 1]
+
+
+def decode_cursor(cursor: str):
+    # "<_id>" for prefix search, "<overlap>-<_id>" for fuzzy
+    overlap, _, last_id = cursor.rpartition("-")
+    return int(overlap) if overlap else None, ObjectId(last_id)
+
+
+def result(row: dict, grams: int = 0) -> dict:
+    return {
+        "id": str(row["_id"]),
+        "name": row.get("name"),
+        "email": row.get("email"),
+        "mobile": row.get("mobile"),
+        "role": row.get("role"),
+        "hashtag": row.get("hashtag"),
+        "verified": row.get("verified"),
+        "created_at": row.get("created_at"),
+        **({"score": round(row["overlap"] / grams, 2)} if grams else {}),
+    }
+
+
+def search(users, query: str | None, role: str | None, fuzzy: bool, cursor: str | None, limit: int):
+    """Returns (users, next_cursor). Raises ValueError for a bad cursor or a too-short query."""
+    try:
+        overlap, last_id = decode_cursor(cursor) if cursor else (None, None)
+    except (ValueError, InvalidId):
+        raise ValueError("Invalid cursor.")
+    query = normalize(query or "")
+    if query and len(query) < PREFIX_MIN:
+        raise ValueError(f"Search for at least {PREFIX_MIN} characters.")
+    match = {"role": role} if role else {}
+
+    if fuzzy and query:
+        grams = trigrams(query)
+        minimum = max(1, round(len(grams) * FUZZY_MIN_SIMILARITY))
+        after = {}
+        if cursor:
+            after = {"$or": [{"overlap": {"$lt": overlap}}, {"overlap": overlap, "_id": {"$lt": last_id}}]}
+        rows = list(users.aggregate([
+            {"$match": {**match, "search_trigrams": {"$in": rare_trigrams(users, match, grams, minimum)}}},
+            # only reached when even the rare trigrams are common; a fixed order
+            # keeps the candidates, and so the pages, the same on every request
+            {"$sort": {"_id": -1}},
+            {"$limit": FUZZY_CANDIDATES},
+            {"$project": {**RESULT_FIELDS, "overlap": {"$size": {"$setIntersection": ["$search_trigrams", grams]}}}},
+            {"$match": {"overlap": {"$gte": minimum}, **after}},
+            {"$sort": {"overlap": -1, "_id": -1}},
+            {"$limit": limit + 1},
+        ]))
+        page = rows[:limit]
+        next_cursor = f"{page[-1]['overlap']}-{page[-1]['_id']}" if len(rows) > limit else None
+        return [result(row, len(grams)) for row in page], next_cursor
+
+    if query and len(query) <= PREFIX_MAX:
+        match["search_prefixes"] = query
+    elif query:
+        # $elemMatch so both bounds apply to the same term (and the index bounds intersect)
+        match["search_terms"] = {"$elemMatch": {"$gte": query, "$lt": query + "\uffff"}}
+    if last_id:
+        match["_id"] = {"$lt": last_id}
+    rows = list(users.find(match, RESULT_FIELDS).sort("_id", -1).limit(limit + 1))
+    page = rows[:limit]
+    next_cursor = str(page[-1]["_id"]) if len(rows) > limit else None
+    return [result(row) for row in page], next_cursor
@@ -1,16 +1,24 @@
 from passlib.context import CryptContext
 import os
+import socket
 import uuid
 
+import tracing
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Identifies this process among the gunicorn workers sharing the database
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    with tracing.span("bcrypt.hash"):
+        return pwd_context.hash(password)
 
 
 def verify_password(password: str, hashed_password: str):
-    return pwd_context.verify(password, hashed_password)
+    with tracing.span("bcrypt.verify"):
+        return pwd_context.verify(password, hashed_password)
 
 
 def generate_filename(filename):
@@ -21,4 +29,28 @@ def generate_filename(filename):
     unique_filename = str(uuid.uuid4())
 
     # Concatenate the filename and extension with the unique filename
-    return f"{unique_filename}{ext}"
\ No newline at end of file
+    return f"{unique_filename}{ext}"
+
+
+def normalize_hashtag(hashtag: str):
+    hashtag = hashtag.strip().lower()
+    if hashtag and not hashtag.startswith("#"):
+        hashtag = f"#{hashtag}"
+    return hashtag
+
+
+def normalize_hashtags(hashtags: str):
+    # "#Summer, sale ,,#summer" -> ["#summer", "#sale"]
+    normalized = []
+    for hashtag in hashtags.split(","):
+        hashtag = normalize_hashtag(hashtag)
+        if hashtag and hashtag not in normalized:
+            normalized.append(hashtag)
+    return normalized
+
+
+def search_key(value: str | None):
+    # lowercased, whitespace-collapsed copy of a field for indexed prefix search
+    if value is None:
+        return None
+    return " ".join(value.lower().split()) or None